@@ -2,6 +2,7 @@
 
 Unit - the meta object for all objects that can be on a map
 Map - a dictionary holding all the spaces on a map
+MapOverlay - a view of a Map with some squares changed, without copying it
 """
 
 #     This part of mPyre, a python implementation of the game Empire
@@ -24,10 +25,17 @@ Map - a dictionary holding all the spaces on a map
 
 
 import os
+import itertools
 import random
+import weakref
+import numpy as np
 import pygame
 
 from GraphicUtils import colors
+from Pathfinding import a_star, reconstruct_path, ch_distance, ClusterGraph, default_cluster_size, \
+    LandmarkTable, default_landmarks
+
+max_terrain_types = 256  #terrain codes must fit in a uint8
 
 infantry_list = ["Infantry",
                  "Grenadiers",
@@ -95,6 +103,7 @@ class Unit(object):
 
         self.move_speed = 0
         self.moved = 0
+        self.goto = None  #a standing GotoOrder, see World.follow_goto
 
         self.max_strength = 1
         self.current_strength = 1 #How much damage the unit can take
@@ -118,19 +127,11 @@ class Unit(object):
     def check_collision(self, coords, G):
         """Check to see if the unit will collide with any units or cities in the game
         G is the game object
-        should be called with the new coords before moving!"""
+        should be called with the new coords before moving!
+        The city, or else the unit, is looked up in the game's Occupancy"""
         if not coords:
             coords = self.coords
-        for c in G.cities:
-            if c.coords == coords:
-                #print("check_collision: collided with {}".format(c.name))
-                return c
-        for u in G.units:
-            if u.coords == coords:
-                "check_collision: collided with {}".format(u.name)
-                return u
-        #print("check_collision: No collision {}".format(coords))
-        return None
+        return G.occupancy.at(coords)
 
     def distance_to(self, unit):
         """Calculate the distance to the given unit"""
@@ -148,13 +149,19 @@ class Unit(object):
             y_dir = (unit.coords[1] - self.coords[1]) / abs(unit.coords[1] - self.coords[1])
         return x_dir, y_dir
 
-def ch_distance(xy1, xy2):
-    """The cherbychev distance between to points"""
-    return max(abs(xy1[0] - xy2[0]),
-               abs(xy1[1] - xy2[1]))
+
+_map_ids = itertools.count()  #for Map.cache_key
+
 
 class Map(dict):
-    """Map - meta object"""
+    """Map - meta object
+
+    Only squares that differ from the default interior are stored in the
+    dict. Map also keeps a count of squares per terrain, and an index of
+    the coordinates of each terrain, so terrain queries like map['water']
+    cost the size of the result rather than a scan of the map. The index of
+    a terrain is built on the first query and kept up to date by
+    __setitem__ from then on."""
 
     def __init__(self, name='The Map', dims=(10,10),
                  default_interior='plains',
@@ -165,19 +172,68 @@ class Map(dict):
         self.interior = default_interior
         self.edge = default_edge
 
+        num_interior = max(dims[0] - 1, 0) * max(dims[1] - 1, 0)
+        self._counts = {default_interior: num_interior,
+                        default_edge: (dims[0] + 1) * (dims[1] + 1) - num_interior}
+        self._index = {}
+        self._passability = {}
+        self._components = {}
+        self._cluster_graphs = {}
+        self._landmarks = {}
+        self.version = 0  #counts terrain changes, for caches of derived data
+        self.cache_id = next(_map_ids)  #unlike id(), never reused by another map
+        self._codes = None
+        self._init_codes([default_interior, default_edge])
+
+        self.shape = (dims[0] + 1, dims[1] + 1)
+        self._width, self._height = self.shape
+        self._init_neighbors()
+
+    @classmethod
+    def from_map(cls, game_map):
+        """Build a map of this class with the same terrain as the given map"""
+        new_map = cls(game_map.name, game_map.dims, game_map.interior, game_map.edge)
+        for xy, terrain in game_map.items():
+            new_map[xy] = terrain
+        return new_map
+
+    def _init_codes(self, terrain_names):
+        """Set up the terrain code table with the given terrain names
+
+        Code c stands for terrain_names[c]. Codes are used by code_array()
+        and by the Map types that store codes instead of names."""
+        self.terrain_names = list(terrain_names)
+        self._code_of = {t: c for c, t in enumerate(self.terrain_names)}
+        self.terrain.update(self.terrain_names)
+        self._interior_code = self.intern(self.interior)
+
+    def intern(self, terrain):
+        """Return the code for the given terrain, adding it to the table if needed"""
+        code = self._code_of.get(terrain)
+        if code is None:
+            code = len(self.terrain_names)
+            if code >= max_terrain_types:
+                raise ValueError("Too many terrain types for a {}: {}".format(self.__class__.__name__,
+                                                                               terrain))
+            self.terrain_names.append(terrain)
+            self._code_of[terrain] = code
+            self.terrain.add(terrain)
+        return code
+
+    def _init_neighbors(self):
+        """Attach the shared neighbor table for this map's dims"""
+        self.neighbor_table = shared_neighbor_table(self.dims)
+        self._all_neighbors = self.neighbor_table.coords['all']
+        self._cardinal_neighbors = self.neighbor_table.coords['cardinal']
+        self._diagonal_neighbors = self.neighbor_table.coords['diagonal']
+        self._flat_neighbors = self.neighbor_table.flat['all']
 
     def __getitem__(self, key):
         if key in self.terrain:
-            if key == self.interior:
-                return [(x, y) for x in range(self.dims[0]) \
-                               for y in range(self.dims[1]) \
-                               if self[(x, y)]==self.interior]
-            if key == self.edge:
-                return [(x, y) for x in range(self.dims[0]) \
-                               for y in range(self.dims[1]) \
-                               if self[(x, y)]==self.edge]
-            else:
-                return [x[0] for x in self.items() if x[1]==key]
+            coords = self._index.get(key)
+            if coords is None:
+                coords = self._index[key] = set(self._scan(key))
+            return list(coords)
         if type(key) is not type(self.dims):
             raise TypeError("Invalid type for map coords: {}".format(key))
         if key[0] > self.dims[0] or key[1] > self.dims[1]:
@@ -195,109 +251,567 @@ class Map(dict):
             raise KeyError("Coordinates out of bounds: {}".format(key))
         if key[0] < 0 or key[1] < 0:
             raise KeyError("Coordinates out of bounds: {}".format(key))
+        old = self[key]
         self.terrain.add(value)
         super(Map, self).__setitem__(key, value)
+        if old != value and not (key[0] in (0, self.dims[0]) or key[1] in (0, self.dims[1])):
+            self._terrain_changed(key, old, value)
+
+    def __delitem__(self, key):
+        old = self[key]
+        super(Map, self).__delitem__(key)
+        new = self[key]
+        if old != new:
+            self._terrain_changed(key, old, new)
+
+    def __copy__(self):
+        new_map = self.__class__(self.name, self.dims, self.interior, self.edge)
+        for key, value in self.items():
+            new_map[key] = value
+        return new_map
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def _scan(self, terrain):
+        """Return the coordinates of every square of the given terrain"""
+        if terrain == self.interior:
+            return [(x, y) for x in range(1, self.dims[0]) \
+                           for y in range(1, self.dims[1]) \
+                           if self.get((x, y), self.interior) == terrain]
+        if terrain == self.edge:
+            coords = [(x, y) for x in range(self.dims[0] + 1) for y in (0, self.dims[1])]
+            coords += [(x, y) for x in (0, self.dims[0]) for y in range(1, self.dims[1])]
+            return coords + [xy for xy, t in self.items() if t == terrain]
+        return [xy for xy, t in self.items() if t == terrain and self[xy] == terrain]
+
+    def _terrain_changed(self, key, old, new):
+        """Update the version, terrain counts, index, passability layers,
+        component labels, cluster graphs, landmark tables and code array
+        after the given square changed"""
+        self.version += 1
+        self._counts[old] -= 1
+        self._counts[new] = self._counts.get(new, 0) + 1
+        if old in self._index:
+            self._index[old].discard(key)
+        if new in self._index:
+            self._index[new].add(key)
+        i = key[0] * self._height + key[1]
+        for cannot_enter, layer in self._passability.items():
+            layer[i] = new not in cannot_enter
+        if self._codes is not None:
+            self._codes[key] = self.intern(new)
+        for graph in self._cluster_graphs.values():
+            graph.terrain_changed(key, old, new)
+        for cannot_enter, num_landmarks in list(self._landmarks):
+            if (old in cannot_enter) != (new in cannot_enter):
+                del self._landmarks[(cannot_enter, num_landmarks)]
+        for cannot_enter, labels in list(self._components.items()):
+            if (old in cannot_enter) == (new in cannot_enter):
+                continue
+            if new in cannot_enter:
+                #The square may have split its component, relabel on next use
+                del self._components[cannot_enter]
+                continue
+            joined = set(labels[n] for n in self.neighbors(key)) - {0}
+            if not joined:
+                labels[key] = labels.max() + 1
+                continue
+            label = min(joined)
+            labels[key] = label
+            for other in joined - {label}:
+                labels[labels == other] = label
+
+    def count(self, terrain):
+        """Return the number of squares of the given terrain"""
+        return self._counts.get(terrain, 0)
+
+    def cache_key(self):
+        """Return a key that changes whenever the terrain of this map changes"""
+        return self.cache_id, self.version
+
+    def passability(self, cannot_enter):
+        """Return the passability layer for units that cannot enter the given terrain
+
+        The layer is a bytearray indexed by flat index (x * (dims[1] + 1) + y)
+        holding 1 for squares that can be entered and 0 for the rest. Layers
+        are built once per distinct cannot_enter and kept up to date by
+        __setitem__, so treat them as read only."""
+        cannot_enter = frozenset(cannot_enter)
+        layer = self._passability.get(cannot_enter)
+        if layer is None:
+            layer = self._passability[cannot_enter] = self._build_passability(cannot_enter)
+        return layer
+
+    def _build_passability(self, cannot_enter):
+        """Build a passability layer from the terrain index"""
+        layer = bytearray(b'\x01') * (self.shape[0] * self.shape[1])
+        for terrain in cannot_enter & self.terrain:
+            for x, y in self[terrain]:
+                layer[x * self._height + y] = 0
+        return layer
+
+    def can_enter(self, xy, cannot_enter):
+        """Return True if a unit that cannot enter the given terrain can enter square xy"""
+        if not (0 <= xy[0] <= self.dims[0] and 0 <= xy[1] <= self.dims[1]):
+            return False
+        return self.passability(cannot_enter)[xy[0] * self._height + xy[1]] == 1
+
+    def passable_array(self, cannot_enter, blocked=()):
+        """Return a boolean array of shape self.shape, True where a unit that
+        cannot enter the given terrain can go
+
+        blocked is an optional collection of coordinates that are also
+        impassable, e.g. squares held by friendly units"""
+        mask = np.frombuffer(self.passability(cannot_enter), dtype=np.bool_).reshape(self.shape).copy()
+        if blocked:
+            xs, ys = zip(*blocked)
+            mask[list(xs), list(ys)] = False
+        return mask
+
+    def components(self, cannot_enter):
+        """Return the connected component labels for units that cannot enter
+        the given terrain
+
+        The labels are an int32 array of shape self.shape: 0 for squares
+        that cannot be entered, and the same positive label for squares
+        joined by a route of 8-way moves, e.g. one label per island for land
+        units. Labels are built once per distinct cannot_enter and kept up to
+        date by __setitem__ (a square becoming impassable may split its
+        component, so that relabels on next use), treat them as read only."""
+        cannot_enter = frozenset(cannot_enter)
+        labels = self._components.get(cannot_enter)
+        if labels is None:
+            passable = np.frombuffer(self.passability(cannot_enter), dtype=np.bool_).reshape(self.shape)
+            labels = self._components[cannot_enter] = label_components(passable)
+        return labels
+
+    def cluster_graph(self, cannot_enter, cluster_size=default_cluster_size):
+        """Return the ClusterGraph hpa_star uses for units that cannot enter
+        the given terrain
+
+        Graphs are made once per cannot_enter and cluster_size. __setitem__
+        marks the clusters a write affects and only those are rebuilt, when
+        the graph is next searched."""
+        key = (frozenset(cannot_enter), cluster_size)
+        graph = self._cluster_graphs.get(key)
+        if graph is None:
+            graph = self._cluster_graphs[key] = ClusterGraph(self, cannot_enter, cluster_size)
+        return graph
+
+    def landmark_table(self, cannot_enter, num_landmarks=default_landmarks):
+        """Return the LandmarkTable alt_star uses for units that cannot enter
+        the given terrain
+
+        Tables are made once per cannot_enter and number of landmarks, and
+        kept with the map until a square changes between passable and not;
+        they are made again on next use."""
+        key = (frozenset(cannot_enter), num_landmarks)
+        table = self._landmarks.get(key)
+        if table is None:
+            table = self._landmarks[key] = LandmarkTable(self, cannot_enter, num_landmarks)
+        return table
+
+    def same_component(self, a, b, cannot_enter):
+        """Return True if a unit that cannot enter the given terrain could
+        get from square a to square b
+
+        Like a_star, square a itself does not have to be passable (a unit
+        can leave a square it could not enter), but square b does."""
+        labels = self.components(cannot_enter)
+        label = labels[b]
+        if not label:
+            return False
+        if labels[a]:
+            return bool(labels[a] == label)
+        return any(labels[n] == label for n in self.neighbors(a))
+
+    def code_array(self):
+        """Return a uint8 array of shape self.shape holding the terrain code of
+        every square, see terrain_names
+
+        The array is built on first use and kept up to date by __setitem__,
+        so treat it as read only."""
+        if self._codes is None:
+            self._codes = self._build_codes()
+        return self._codes
+
+    def _build_codes(self):
+        """Build the code array from the stored squares"""
+        codes = np.full(self.shape, self._interior_code, dtype=np.uint8)
+        codes[(0, -1), :] = self.intern(self.edge)
+        codes[:, (0, -1)] = self.intern(self.edge)
+        for xy in self.keys():
+            codes[xy] = self.intern(self[xy])  #stored edges still read as edge
+        return codes
+
+    def terrain_mask(self, terrains):
+        """Return a boolean array of shape self.shape, True where the terrain is one of terrains"""
+        return np.isin(self.code_array(), [self._code_of[t] for t in terrains if t in self._code_of])
+
+    def terrain_at(self, coords):
+        """Return an array of the terrain codes of a sequence or (n, 2) array of coordinates"""
+        coords = np.asarray(coords, dtype=np.intp).reshape(-1, 2)
+        return self.code_array()[coords[:, 0], coords[:, 1]]
+
+    def rect(self, x0, y0, x1, y1):
+        """Return a copy of the terrain codes of squares x0 <= x < x1, y0 <= y < y1
+
+        Like a slice, the rectangle is clipped to the map"""
+        return self.code_array()[max(x0, 0):max(x1, 0), max(y0, 0):max(y1, 0)].copy()
+
+    def window(self, xy, r):
+        """Return the terrain codes within Chebyshev distance r of xy, clipped
+        to the map, and the coordinates of the window's first square"""
+        x0, y0 = max(xy[0] - r, 0), max(xy[1] - r, 0)
+        return self.rect(x0, y0, xy[0] + r + 1, xy[1] + r + 1), (x0, y0)
+
+    def within(self, xy, r):
+        """Return an (n, 2) array of the coordinates within Chebyshev distance r
+        of xy and an array of their terrain codes"""
+        codes, (x0, y0) = self.window(xy, r)
+        xs, ys = np.indices(codes.shape)
+        return np.column_stack([xs.ravel() + x0, ys.ravel() + y0]), codes.ravel()
+
+    def window_counts(self, xy, r):
+        """Return the number of squares of each terrain code within Chebyshev
+        distance r of xy"""
+        codes, _ = self.window(xy, r)
+        return np.bincount(codes.ravel(), minlength=len(self.terrain_names))
+
+    def neighbor_counts(self, terrains, kind='all'):
+        """Return an array of shape self.shape with the number of neighbors of
+        each square whose terrain is one of terrains
+
+        kind is 'all', 'cardinal' or 'diagonal', as in neighbor_steps"""
+        padded = np.pad(self.terrain_mask(terrains).astype(np.uint8), 1)
+        counts = np.zeros(self.shape, dtype=np.uint8)
+        for dx, dy in neighbor_steps[kind]:
+            counts += padded[1 + dx:1 + dx + self.shape[0], 1 + dy:1 + dy + self.shape[1]]
+        return counts
 
     def neighbors(self, xy):
-        """Return a list of coordinates of the neighbors of the given square"""
-        ne_list = []
-        for x, y in [(-1, 1), (0, 1), (1, 1),
-                     (-1, 0), (1, 0),
-                     (-1, -1), (0, -1), (1, -1)]:
-                if (0 <= xy[0] + x <= self.dims[0]) and \
-                   (0 <= xy[1] + y <= self.dims[1]):
-                    ne_list.append((xy[0] + x,
-                                    xy[1] + y))
-        return ne_list
+        """Return the coordinates of the neighbors of the given square
+
+        The tuple is shared through the neighbor table, do not modify it"""
+        if not (0 <= xy[0] < self._width and 0 <= xy[1] < self._height):
+            return self._off_map_neighbors('all', xy)
+        i = xy[0] * self._height + xy[1]
+        return self._all_neighbors[i] or self.neighbor_table.neighbors('all', i)
 
     def cardinal_neighbors(self, xy):
-        """Return a list of coordinates of the neighbors of the given square
+        """Return the coordinates of the neighbors of the given square
         in the cardinal directions (N, E, S, W)"""
-        ne_list = []
-        for x, y in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-            if (0 <= xy[0] + x <= self.dims[0]) and \
-               (0 <= xy[1] + y <= self.dims[1]):
-                ne_list.append((xy[0] + x,
-                                xy[1] + y))
-        return ne_list
+        if not (0 <= xy[0] < self._width and 0 <= xy[1] < self._height):
+            return self._off_map_neighbors('cardinal', xy)
+        i = xy[0] * self._height + xy[1]
+        return self._cardinal_neighbors[i] or self.neighbor_table.neighbors('cardinal', i)
 
     def diagonal_neighbors(self, xy):
-        """Return a list of coordinates of the neighbors of the given square
+        """Return the coordinates of the neighbors of the given square
                 in the diagonal directions"""
-        ne_list = []
-        for x, y in [(1, 1), (-1, 1), (-1, -1), (1, -1)]:
-            if (0 <= xy[0] + x <= self.dims[0]) and \
-               (0 <= xy[1] + y <= self.dims[1]):
-                ne_list.append((xy[0] + x,
-                                xy[1] + y))
-        return ne_list
-
-def reconstruct_path(came_from, current):
-    """reconstruct the path
-
-    current is the end point
-    came_from is dict whose keys are coordinates and values are the previous coordinates"""
-    total_path = [current]
-    while current in came_from.keys():
-        current = came_from[current]
-        total_path.append(current)
-    total_path.reverse()
-    return total_path
-
-
-def a_star(start, goal, game_map,
-           cannot_enter=['edge', 'water']):
-    """A* finds a path from the units location to goal.
-
-    start and goal are 2D coordinates
-    game_map is the map object with terrain.
-    cannot_enter is a list of impassible terrain
-
-    from the wiki page: https://en.wikipedia.org/wiki/A*_search_algorithm"""
-
-    # The set of discovered nodes that may need to be (re-)expanded.
-    # Initially, only the start node is known.
-    open_set = set([start])
-
-    # For node n, cameFrom[n] is the node immediately preceding it on the cheapest path from start to n currently known.
-    came_from = {}
-
-    #For node n, g_score[n] is the cost of the cheapest path from start to n currently known.
-    g_score = Map('G score', game_map.dims, 999999999, 9999999999)
-    g_score[start] = 0
-
-    #For node n, f_score[n] = g_score[n] + h(n).
-    f_score = Map('F score', game_map.dims, 999999999, 9999999999)
-    f_score[start] = ch_distance(start, goal)
-
-    while len(open_set) > 0:
-        min_f = min([kv[1] for kv in f_score.items() if kv[0] in open_set])
-        current = random.choice([kv[0] for kv in f_score.items() if (kv[0] in open_set and kv[1] == min_f)])
-        # print("{} fscore: {} gscore: {}".format(current,
-        #                                         f_score[current],
-        #                                         g_score[current]))
-        if current == goal:
-            return reconstruct_path(came_from, current)
-
-        open_set.remove(current)
-        for neighbor in game_map.neighbors(current):
-            #d(current, neighbor) is the weight of the edge from current to neighbor
-            #tentative_g_score is the distance from start to the neighbor through current
-            # print("{} is {} is it in {}?".format(neighbor,
-            #                                      game_map[neighbor],
-            #                                      cannot_enter))
-            if game_map[neighbor] not in cannot_enter:
-                tentative_g_score = g_score[current] + 1
-            else:
-                tentative_g_score = g_score[neighbor]
-            if tentative_g_score < g_score[neighbor]:
-                #This path to neighbor is better than any previous one. Record it!
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = g_score[neighbor] + ch_distance(neighbor, goal)
-                if neighbor not in open_set:
-                    open_set.add(neighbor)
-    #open_set is empty but goal was never reached
-    return False
+        if not (0 <= xy[0] < self._width and 0 <= xy[1] < self._height):
+            return self._off_map_neighbors('diagonal', xy)
+        i = xy[0] * self._height + xy[1]
+        return self._diagonal_neighbors[i] or self.neighbor_table.neighbors('diagonal', i)
+
+    def flat_neighbors(self, i):
+        """Return the flat indices of the neighbors of the square with flat index i"""
+        return self._flat_neighbors[i] or self.neighbor_table.flat_neighbors('all', i)
+
+    def _off_map_neighbors(self, kind, xy):
+        """Return the on-map neighbors of a square outside the map
+
+        The flat index of such a square would alias a square on the map, so
+        these are worked out from neighbor_steps instead of the shared table"""
+        return tuple((xy[0] + dx, xy[1] + dy) for dx, dy in neighbor_steps[kind]
+                     if 0 <= xy[0] + dx < self._width and 0 <= xy[1] + dy < self._height)
+
+
+class MapOverlay(object):
+    """MapOverlay - a read only view of a Map with a few squares changed
+
+    base is the Map to view. overrides maps coordinates to the terrain to
+    report there instead, and every square in blocked reads as the base
+    map's edge terrain, e.g. the squares held by friendly units. The base
+    map is not copied, so making an overlay costs the number of changed
+    squares. Lookups, neighbors and passability answer like the base map
+    with the changes applied; a passability layer is an OverlayLayer that
+    reads the changed squares first and the base layer otherwise."""
+
+    def __init__(self, base, blocked=(), overrides=None):
+        self.base = base
+        self.name = base.name
+        self.dims = base.dims
+        self.shape = base.shape
+        self.interior = base.interior
+        self.edge = base.edge
+        self.overrides = dict(overrides) if overrides else {}
+        for xy in blocked:
+            self.overrides[xy] = base.edge
+        self.terrain = base.terrain | set(self.overrides.values())
+        self.overlay_key = frozenset(self.overrides.items())
+        self._height = base.shape[1]
+        self._passability = {}
 
+    def __getitem__(self, key):
+        if key in self.overrides:
+            return self.overrides[key]
+        if key in self.terrain:
+            coords = [xy for xy in self.base[key] if xy not in self.overrides] \
+                     if key in self.base.terrain else []
+            return coords + [xy for xy, t in self.overrides.items() if t == key]
+        return self.base[key]
+
+    def count(self, terrain):
+        """Return the number of squares of the given terrain"""
+        n = self.base.count(terrain)
+        for xy, t in self.overrides.items():
+            n += (t == terrain) - (self.base[xy] == terrain)
+        return n
+
+    @property
+    def version(self):
+        return self.base.version
+
+    @property
+    def terrain_names(self):
+        """The base map's terrain names, then any terrain only the changed squares have"""
+        names = list(self.base.terrain_names)
+        names.extend(t for t in dict.fromkeys(self.overrides.values()) if t not in names)
+        return names
+
+    def code_array(self):
+        """Return a copy of the base map's code array with the changed squares applied
+
+        Codes are indexes into terrain_names; the base map is not changed"""
+        codes = self.base.code_array().copy()
+        code_of = {t: c for c, t in enumerate(self.terrain_names)}
+        for (x, y), terrain in self.overrides.items():
+            codes[x, y] = code_of[terrain]
+        return codes
+
+    def cache_key(self):
+        """Return a key that changes whenever the base map or the changed squares differ"""
+        return self.base.cache_key() + (self.overlay_key,)
+
+    def passability(self, cannot_enter):
+        """Return the passability layer of the base map with the changed squares applied"""
+        cannot_enter = frozenset(cannot_enter)
+        layer = self._passability.get(cannot_enter)
+        if layer is None:
+            changed = {x * self._height + y: int(terrain not in cannot_enter)
+                       for (x, y), terrain in self.overrides.items()}
+            layer = OverlayLayer(self.base.passability(cannot_enter), changed)
+            self._passability[cannot_enter] = layer
+        return layer
+
+    def can_enter(self, xy, cannot_enter):
+        """Return True if a unit that cannot enter the given terrain can enter square xy"""
+        if xy in self.overrides:
+            return self.overrides[xy] not in cannot_enter
+        return self.base.can_enter(xy, cannot_enter)
+
+    def passable_array(self, cannot_enter, blocked=()):
+        """Return a boolean array of shape self.shape, True where a unit that
+        cannot enter the given terrain can go"""
+        mask = self.base.passable_array(cannot_enter)
+        for (x, y), terrain in self.overrides.items():
+            mask[x, y] = terrain not in cannot_enter
+        if blocked:
+            xs, ys = zip(*blocked)
+            mask[list(xs), list(ys)] = False
+        return mask
+
+    def cluster_graph(self, cannot_enter, cluster_size=default_cluster_size):
+        """Return the base map's ClusterGraph, the changed squares are not in it"""
+        return self.base.cluster_graph(cannot_enter, cluster_size)
+
+    def landmark_table(self, cannot_enter, num_landmarks=default_landmarks):
+        """Return the base map's LandmarkTable, or None if an override opens
+        a square, which could make a route shorter than its bounds"""
+        base_layer = self.base.passability(cannot_enter)
+        height = self.base.dims[1] + 1
+        if any(t not in cannot_enter and not base_layer[x * height + y]
+               for (x, y), t in self.overrides.items()):
+            return None
+        return self.base.landmark_table(cannot_enter, num_landmarks)
+
+    def same_component(self, a, b, cannot_enter):
+        """Return False if a unit that cannot enter the given terrain could
+        not get from square a to square b
+
+        Blocked squares only take routes away, so unless an override opens up
+        a square the base map's components answer; True then means a and b
+        are connected on the base map, not that the blocked squares leave a
+        route."""
+        opened = [xy for xy, t in self.overrides.items()
+                  if t not in cannot_enter and not self.base.can_enter(xy, cannot_enter)]
+        if not opened:
+            return self.base.same_component(a, b, cannot_enter)
+        labels = label_components(self.passable_array(cannot_enter))
+        if not labels[b]:
+            return False
+        if labels[a]:
+            return bool(labels[a] == labels[b])
+        return any(labels[n] == labels[b] for n in self.neighbors(a))
 
+    def neighbors(self, xy):
+        return self.base.neighbors(xy)
+
+    def cardinal_neighbors(self, xy):
+        return self.base.cardinal_neighbors(xy)
+
+    def diagonal_neighbors(self, xy):
+        return self.base.diagonal_neighbors(xy)
+
+    def flat_neighbors(self, i):
+        return self.base.flat_neighbors(i)
+
+
+class OverlayLayer(object):
+    """The passability layer of a MapOverlay
+
+    Indexes like the base map's layer, 1 where a square can be entered, but
+    squares in changed (flat index -> 0 or 1) answer from there and the rest
+    read the base layer, so the base layer is never copied. bytes() builds a
+    full copy for the code that needs a buffer."""
+
+    __slots__ = ('base', 'changed')
+
+    def __init__(self, base, changed):
+        self.base = base
+        self.changed = changed
+
+    def __getitem__(self, i):
+        value = self.changed.get(i)
+        return self.base[i] if value is None else value
+
+    def __len__(self):
+        return len(self.base)
+
+    def __bytes__(self):
+        layer = bytearray(self.base)
+        for i, value in self.changed.items():
+            layer[i] = value
+        return bytes(layer)
+
+
+def label_components(passable):
+    """Label the 8-way connected regions of a boolean array of shape (x, y)
+
+    Returns an int32 array holding 0 where passable is False and labels
+    1, 2, ... for the regions. Each column is split into runs of passable
+    squares, runs touching a run of the previous column (diagonals
+    included) are joined with union-find, so the Python work grows with the
+    number of runs rather than the number of squares."""
+    parent = [0]
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    runs = []
+    previous = []
+    padded = np.zeros(passable.shape[1] + 2, dtype=np.int8)
+    for x in range(passable.shape[0]):
+        padded[1:-1] = passable[x]
+        steps = np.diff(padded)
+        column = []
+        j = 0
+        for y0, y1 in zip(np.flatnonzero(steps == 1).tolist(), np.flatnonzero(steps == -1).tolist()):
+            run = len(parent)
+            parent.append(run)
+            #Runs of the previous column touch this one if they overlap y0 - 1 to y1
+            while j < len(previous) and previous[j][1] < y0:
+                j += 1
+            k = j
+            while k < len(previous) and previous[k][0] <= y1:
+                root, other = find(run), find(previous[k][2])
+                if root != other:
+                    parent[max(root, other)] = min(root, other)
+                k += 1
+            column.append((y0, y1, run))
+            runs.append((x, y0, y1, run))
+        previous = column
+
+    labels = np.zeros(passable.shape, dtype=np.int32)
+    label_of = {}
+    for x, y0, y1, run in runs:
+        root = find(run)
+        label = label_of.get(root)
+        if label is None:
+            label = label_of[root] = len(label_of) + 1
+        labels[x, y0:y1] = label
+    return labels
+
+
+neighbor_steps = {'all': [(-1, 1), (0, 1), (1, 1),
+                          (-1, 0), (1, 0),
+                          (-1, -1), (0, -1), (1, -1)],
+                  'cardinal': [(1, 0), (-1, 0), (0, 1), (0, -1)],
+                  'diagonal': [(1, 1), (-1, 1), (-1, -1), (1, -1)]}
+
+#Maps hold their table, so a table lives as long as some map of its dims
+_neighbor_tables = weakref.WeakValueDictionary()
+
+def shared_neighbor_table(dims):
+    """Return the NeighborTable for maps of the given dims, building it once
+    while any map of those dims is alive"""
+    table = _neighbor_tables.get(dims)
+    if table is None:
+        table = _neighbor_tables[dims] = NeighborTable(dims)
+    return table
+
+
+class NeighborTable(object):
+    """Adjacency tables for every square of a map of the given dims
+
+    Square (x, y) has the flat index x * (dims[1] + 1) + y. For each kind of
+    neighborhood in neighbor_steps the flat indices of the neighbors of
+    square i are indices[kind][offsets[kind][i]:offsets[kind][i + 1]] (CSR
+    form). The tuples returned by neighbors() and flat_neighbors() are built
+    from those arrays on first use and reused afterwards, so the lookups in
+    the pathfinding and map generation loops allocate nothing."""
+
+    def __init__(self, dims):
+        self.dims = dims
+        self.height = dims[1] + 1
+        self.size = (dims[0] + 1) * self.height
+        self.offsets = {}
+        self.indices = {}
+        self.coords = {}
+        self.flat = {}
+
+        xs, ys = np.divmod(np.arange(self.size, dtype=np.int32), self.height)
+        for kind, steps in neighbor_steps.items():
+            nx = np.array([xs + dx for dx, dy in steps])
+            ny = np.array([ys + dy for dx, dy in steps])
+            valid = (nx >= 0) & (nx <= dims[0]) & (ny >= 0) & (ny <= dims[1])
+            offsets = np.zeros(self.size + 1, dtype=np.int32)
+            np.cumsum(valid.sum(axis=0), out=offsets[1:])
+            #Transpose so the neighbors of each square are contiguous, in step order
+            self.offsets[kind] = offsets
+            self.indices[kind] = (nx * self.height + ny).T[valid.T].astype(np.int32)
+            self.coords[kind] = [None] * self.size
+            self.flat[kind] = [None] * self.size
+
+    def flat_neighbors(self, kind, i):
+        """Return a tuple of the flat indices of the neighbors of square i"""
+        ne = self.flat[kind][i]
+        if ne is None:
+            offsets = self.offsets[kind]
+            ne = tuple(self.indices[kind][offsets[i]:offsets[i + 1]].tolist())
+            self.flat[kind][i] = ne
+        return ne
+
+    def neighbors(self, kind, i):
+        """Return a tuple of the coordinates of the neighbors of square i"""
+        ne = self.coords[kind][i]
+        if ne is None:
+            ne = tuple(divmod(j, self.height) for j in self.flat_neighbors(kind, i))
+            self.coords[kind][i] = ne
+        return ne
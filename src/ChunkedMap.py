@@ -0,0 +1,225 @@
+"""ChunkedMap - A sparse Map for very large worlds
+
+ChunkedMap - a Map that allocates terrain storage in square chunks on first write
+"""
+
+#     This part of mPyre, a python implementation of the game Empire
+#     Copyright (C) 2019  Robert C. Ramsdell III <rcriii42@gmail.com>
+#
+#     mPyre is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     mPyre is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with mPyre.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Work started on 18 October, 2026
+
+import numpy as np
+
+from BaseObjects import Map, neighbor_steps
+from GridMap import CodedMap
+
+default_chunk_size = 64
+
+
+class ChunkedMap(CodedMap):
+    """ChunkedMap - a Map storing terrain codes in lazily allocated chunks
+
+    The map is split into chunk_size x chunk_size chunks. A chunk is only
+    allocated, as a bytearray of terrain codes, when one of its squares is
+    first set to something other than the default interior. Unallocated
+    chunks read as default interior and edges are not stored at all, so
+    memory grows with the terrain placed rather than with the area.
+    Terrain queries for anything but the interior, items() and len() only
+    visit the allocated chunks.
+
+    The shared neighbor table is not used since its arrays grow with the
+    area; neighbors are computed on each call instead. Passability layers
+    are still one byte per square."""
+
+    def __init__(self, name='The Map', dims=(10,10),
+                 default_interior='plains',
+                 default_edge='edge',
+                 chunk_size=default_chunk_size):
+        if chunk_size < 1 or chunk_size & (chunk_size - 1):
+            raise ValueError("chunk_size must be a power of two: {}".format(chunk_size))
+        Map.__init__(self, name, dims, default_interior, default_edge)
+        self.chunk_size = chunk_size
+        self._shift = chunk_size.bit_length() - 1
+        self._mask = chunk_size - 1
+        self.chunks = {}
+
+    def _init_neighbors(self):
+        self.neighbor_table = None
+
+    def __getitem__(self, key):
+        if key in self._code_of:
+            return self._terrain_coords(key)
+        self._check_coords(key)
+        x, y = key
+        if x in (0, self.dims[0]) or y in (0, self.dims[1]):
+            return self.edge
+        chunk = self.chunks.get((x >> self._shift, y >> self._shift))
+        if chunk is None:
+            return self.interior
+        return self.terrain_names[chunk[((x & self._mask) << self._shift) | (y & self._mask)]]
+
+    def __setitem__(self, key, value):
+        self._check_coords(key)
+        code = self.intern(value)
+        x, y = key
+        if x in (0, self.dims[0]) or y in (0, self.dims[1]):
+            return  #Edges always read as the edge terrain
+        chunk_key = (x >> self._shift, y >> self._shift)
+        chunk = self.chunks.get(chunk_key)
+        if chunk is None:
+            if code == self._interior_code:
+                return
+            chunk = bytearray([self._interior_code]) * (self.chunk_size * self.chunk_size)
+            self.chunks[chunk_key] = chunk
+        i = ((x & self._mask) << self._shift) | (y & self._mask)
+        old_code = chunk[i]
+        if old_code != code:
+            chunk[i] = code
+            self._terrain_changed(key, self.terrain_names[old_code], value)
+
+    def __copy__(self):
+        new_map = self.__class__(self.name, self.dims, self.interior, self.edge,
+                                 self.chunk_size)
+        new_map._init_codes(self.terrain_names)
+        new_map.chunks = {k: bytearray(c) for k, c in self.chunks.items()}
+        new_map._counts = dict(self._counts)
+        return new_map
+
+    def get(self, key, default=None):
+        if type(key) is not type(self.dims):
+            return default
+        if not (0 < key[0] < self.dims[0] and 0 < key[1] < self.dims[1]):
+            return default
+        chunk = self.chunks.get((key[0] >> self._shift, key[1] >> self._shift))
+        if chunk is None:
+            return default
+        code = chunk[((key[0] & self._mask) << self._shift) | (key[1] & self._mask)]
+        if code == self._interior_code:
+            return default
+        return self.terrain_names[code]
+
+    def _chunk_array(self, chunk_key):
+        """Return the codes of the given chunk as a chunk_size x chunk_size array"""
+        chunk = self.chunks.get(chunk_key)
+        if chunk is None:
+            return np.full((self.chunk_size, self.chunk_size), self._interior_code, dtype=np.uint8)
+        return np.frombuffer(chunk, dtype=np.uint8).reshape(self.chunk_size, self.chunk_size)
+
+    def _chunk_squares(self, chunk_key, mask):
+        """Return the x and y arrays of the interior squares of a chunk selected by mask"""
+        xs, ys = np.nonzero(mask)
+        xs += chunk_key[0] * self.chunk_size
+        ys += chunk_key[1] * self.chunk_size
+        inside = (xs > 0) & (xs < self.dims[0]) & (ys > 0) & (ys < self.dims[1])
+        return xs[inside], ys[inside]
+
+    def _all_chunk_keys(self):
+        """Return the keys of every chunk covering the map, allocated or not"""
+        return [(cx, cy) for cx in range((self.dims[0] >> self._shift) + 1)
+                         for cy in range((self.dims[1] >> self._shift) + 1)]
+
+    def _terrain_coords(self, terrain):
+        """Return the coordinates of every square of the given terrain
+
+        Only the interior query has to visit unallocated chunks"""
+        code = self._code_of[terrain]
+        coords = []
+        if terrain == self.edge:
+            coords += [(x, y) for x in range(self.dims[0] + 1) for y in (0, self.dims[1])]
+            coords += [(x, y) for x in (0, self.dims[0]) for y in range(1, self.dims[1])]
+        if code == self._interior_code:
+            chunk_keys = self._all_chunk_keys()
+        else:
+            chunk_keys = list(self.chunks)
+        for chunk_key in chunk_keys:
+            xs, ys = self._chunk_squares(chunk_key, self._chunk_array(chunk_key) == code)
+            coords.extend(zip(xs.tolist(), ys.tolist()))
+        return coords
+
+    def items(self):
+        names = self.terrain_names
+        stored = []
+        for chunk_key in self.chunks:
+            codes = self._chunk_array(chunk_key)
+            xs, ys = self._chunk_squares(chunk_key, codes != self._interior_code)
+            local_xs = xs - chunk_key[0] * self.chunk_size
+            local_ys = ys - chunk_key[1] * self.chunk_size
+            stored.extend(((x, y), names[c]) for x, y, c in zip(xs.tolist(),
+                                                                 ys.tolist(),
+                                                                 codes[local_xs, local_ys].tolist()))
+        return stored
+
+    def __len__(self):
+        num_edges = self.shape[0] * self.shape[1] - max(self.dims[0] - 1, 0) * max(self.dims[1] - 1, 0)
+        return sum(n for t, n in self._counts.items() if t != self.interior) - num_edges
+
+    def code_array(self):
+        """Return a uint8 array of shape self.shape holding the terrain code of
+        every square, see Map.code_array
+
+        The array is built from the chunks on every call and not kept, so the
+        map only ever holds its allocated chunks."""
+        return self._build_codes()
+
+    def _build_codes(self):
+        """Build the full code array from the allocated chunks"""
+        codes = np.full(self.shape, self._interior_code, dtype=np.uint8)
+        for (cx, cy), chunk in self.chunks.items():
+            x0, y0 = cx * self.chunk_size, cy * self.chunk_size
+            x1 = min(x0 + self.chunk_size, self.shape[0])
+            y1 = min(y0 + self.chunk_size, self.shape[1])
+            codes[x0:x1, y0:y1] = self._chunk_array((cx, cy))[:x1 - x0, :y1 - y0]
+        codes[(0, -1), :] = self.intern(self.edge)
+        codes[:, (0, -1)] = self.intern(self.edge)
+        return codes
+
+    def _build_passability(self, cannot_enter):
+        """Build a passability layer, filling in only the allocated chunks"""
+        layer = bytearray([self.interior not in cannot_enter]) * (self.shape[0] * self.shape[1])
+        grid = np.frombuffer(layer, dtype=np.uint8).reshape(self.shape)
+        lookup = np.array([t not in cannot_enter for t in self.terrain_names], dtype=np.uint8)
+        for (cx, cy), chunk in self.chunks.items():
+            x0, y0 = cx * self.chunk_size, cy * self.chunk_size
+            x1 = min(x0 + self.chunk_size, self.shape[0])
+            y1 = min(y0 + self.chunk_size, self.shape[1])
+            grid[x0:x1, y0:y1] = lookup[self._chunk_array((cx, cy))[:x1 - x0, :y1 - y0]]
+        grid[(0, -1), :] = self.edge not in cannot_enter
+        grid[:, (0, -1)] = self.edge not in cannot_enter
+        return layer
+
+    def _step_neighbors(self, xy, steps):
+        """Return the coordinates of the squares one step away in each direction"""
+        return tuple((xy[0] + x, xy[1] + y) for x, y in steps
+                     if 0 <= xy[0] + x <= self.dims[0] and 0 <= xy[1] + y <= self.dims[1])
+
+    def neighbors(self, xy):
+        """Return the coordinates of the neighbors of the given square"""
+        return self._step_neighbors(xy, neighbor_steps['all'])
+
+    def cardinal_neighbors(self, xy):
+        """Return the coordinates of the neighbors of the given square
+        in the cardinal directions (N, E, S, W)"""
+        return self._step_neighbors(xy, neighbor_steps['cardinal'])
+
+    def diagonal_neighbors(self, xy):
+        """Return the coordinates of the neighbors of the given square
+                in the diagonal directions"""
+        return self._step_neighbors(xy, neighbor_steps['diagonal'])
+
+    def flat_neighbors(self, i):
+        """Return the flat indices of the neighbors of the square with flat index i"""
+        height = self._height
+        return tuple(x * height + y for x, y in self.neighbors(divmod(i, height)))
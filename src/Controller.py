@@ -20,15 +20,17 @@
 
 import random
 import Game
-from BaseObjects import Unit
+from BaseObjects import Unit, Map
+from Pathfinding import GotoOrder
+from GroundUnits import direction_keys
 
 class World(object):
     """ global controller construct"""
-    def __init__(self, size):
+    def __init__(self, size, map_class=Map, map_file=None):
         self.id=random.randint(101,1001)
         self.end = False
 
-        self.G = Game.Game(size)
+        self.G = Game.Game(size, map_class, map_file)
         self.history = {}
 
     @property
@@ -79,6 +81,34 @@ class World(object):
             else:
                 return target_unit
 
+    def execute_moves(self, moves):
+        """Move each unit of a list of (unit, key) moves, e.g. an AI's planned_moves
+
+        Units lost earlier in the list are skipped. Returns the results of move_unit"""
+        results = []
+        for unit, key in moves:
+            if unit.owner and unit in unit.owner.units:
+                results.append(self.move_unit(unit, key))
+        return results
+
+    def goto(self, unit, target):
+        """Give the unit a standing order to move to the target, a City, a unit or coordinates"""
+        unit.goto = GotoOrder(target, unit.cannot_enter, cache=self.G.path_cache)
+
+    def follow_goto(self, unit):
+        """Move the unit one step along its goto order
+
+        Friendly units in the way are routed around. The order is dropped
+        once the unit is at the target or cannot reach it.
+        Returns the result of move_unit, or None if the unit did not move"""
+        friendly = [u.coords for u in unit.owner.units if u is not unit]
+        step = unit.goto.next_step(unit.coords, self.G.map, friendly)
+        if step is None:
+            unit.goto = None
+            return None
+        return self.move_unit(unit, direction_keys[(step[0] - unit.coords[0],
+                                                    step[1] - unit.coords[1])])
+
     def resolve_combat(self, attacker, defender):
         """Resolve an attack by one unit on another
 
@@ -94,14 +124,14 @@ class World(object):
                     attacker.owner.assign_city(defender)
                     defender.plane.destroy()
                     defender.plane = None
-                    attacker.owner.units.remove(attacker)
+                    attacker.owner.remove_unit(attacker)
                     attacker.plane.destroy()
                     attacker.plane = None
                     return False
                 else:
                     #A unit is destroyed
                     #print("resolve_combat: {} defeated {}".format(attacker.name, defender.name))
-                    defender.owner.units.remove(defender)
+                    defender.owner.remove_unit(defender)
                     defender.plane.destroy()
                     defender.plane = None
                     return True
@@ -110,7 +140,7 @@ class World(object):
             if attacker.current_strength <= 0:
                 #Attacker destroyed
                 #print("resolve_combat: {} defeated by {}".format(attacker.name, defender.name))
-                attacker.owner.units.remove(attacker)
+                attacker.owner.remove_unit(attacker)
                 attacker.plane.destroy()
                 attacker.plane = None
             return False
\ No newline at end of file
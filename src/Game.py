@@ -26,7 +26,9 @@ from Player import Player
 from GroundUnits import Infantry
 from Player_AI import AI
 from  BaseObjects import Map, Namer
+from Pathfinding import FlowFields, PathCache
 import MapBuilder
+import MapFile
 
 Demo = True
 
@@ -37,11 +39,48 @@ def comprehension_flatten(iter_lst):
 player_namer = Namer(name_list=["Joe", "Svetlana", "Estefan", "Wang Xiu Ying"],
                      number_names=False)
 
+class Occupancy(object):
+    """Occupancy - the city and units on each square
+
+    Owned by the Game and kept up to date as units are made
+    (Player.assign_unit), move (move) and are lost (Player.remove_unit), so
+    Unit.check_collision is a dict lookup instead of a scan of every city
+    and unit. Cities never move, so they are indexed once."""
+
+    def __init__(self, cities=()):
+        self.cities = dict((c.coords, c) for c in cities)
+        self.units = {}  #coords: the units there, more than one only in a city
+
+    def at(self, coords):
+        """Return the city on the square, else the first unit there, else None"""
+        city = self.cities.get(coords)
+        if city is not None:
+            return city
+        units = self.units.get(coords)
+        return units[0] if units else None
+
+    def add(self, unit):
+        self.units.setdefault(unit.coords, []).append(unit)
+
+    def remove(self, unit):
+        units = self.units.get(unit.coords)
+        if units and unit in units:
+            units.remove(unit)
+            if not units:
+                del self.units[unit.coords]
+
+    def move(self, unit, coords):
+        """Move the unit to the given square"""
+        self.remove(unit)
+        unit.coords = coords
+        self.add(unit)
+
+
 def furthest_city_coords(map, coords):
     """find the furthest city on the map from the given coordinates
 
     Returns the coordinates of that city"""
-    city_coords = [c[0] for c in map.items() if c[1]=="city"]
+    city_coords = map["city"]
     distances = [max(abs(coords[0]-c[0]), abs(coords[1]-c[1])) for c in city_coords]
     so = sorted([x for x in zip(city_coords, distances)],
                 key=lambda tup: tup[1])
@@ -50,18 +89,37 @@ def furthest_city_coords(map, coords):
 class Game(object):
     """Holds the various game objects"""
 
-    def __init__(self, size):
+    def __init__(self, size, map_class=Map, map_file=None):
+        """Set up a new game
+
+        size is the size of the map to generate
+        map_class is the Map type to generate, or to load map_file into
+        map_file is a map saved with MapFile.save_map, used instead of
+         generating a map if given"""
         self.turn = 1
 
-        self.map, self.cities = MapBuilder.map_builder(size)
+        if map_file:
+            self.map, self.cities = MapFile.load_map(map_file, map_class=map_class)
+        else:
+            self.map, self.cities = MapBuilder.map_builder(size, map_class=map_class)
+        #Distance fields towards targets, shared by the AI players for the turn
+        self.flow_fields = FlowFields(self.map)
+        #Routes of the units' goto orders, shared by all the players
+        self.path_cache = PathCache()
+
+        #Which city or unit is on each square, for check_collision
+        self.occupancy = Occupancy(self.cities)
 
         self.neutral = Player(name="Neutral", color = "white")
+        self.neutral.occupancy = self.occupancy
         for c in self.cities:
             self.neutral.assign_city(c, build_unit=False)
 
         self.players = [Player(name=player_namer.name_unit()),
                         Player(name=player_namer.name_unit(), color='blue'),
                         Player(name=player_namer.name_unit(), color='orange')]
+        for p in self.players:
+            p.occupancy = self.occupancy
 
         self.players[0].assign_city(self.cities[0])
         self.players[0].assign_unit(Infantry(coords=(self.cities[0].coords[0],
@@ -126,6 +184,7 @@ class Game(object):
         """advance the turn and reset players"""
         self.turn += 1
         self.player_turn_list = self.players.copy()
+        self.flow_fields.new_turn()
         return ["Turn: {}".format(self.turn)]
 
     def player_lost(self, p):
@@ -166,6 +166,8 @@ class GameWindow(object):
         self.city_bubble = None
 
         self.advance_turn = False
+        self.played_plan = None  #the AI player and turn whose plan was played, see play_plan
+        self.followed_orders = None  #the player and turn whose goto orders were followed
 
         pygame.display.flip()
 
@@ -274,6 +276,47 @@ class GameWindow(object):
         self.selected = None
         self.advance_turn = True
 
+    def place_unit(self, unit):
+        """Move the unit's plane to the unit's square, if it still has a plane"""
+        if unit.plane:
+            vector = (unit.coords[0] * self.image_size - unit.plane.rect.x,
+                      unit.coords[1] * self.image_size - unit.plane.rect.y)
+            unit.plane.rect.move_ip(vector)
+
+    def play_plan(self, player):
+        """Make the moves the AI player planned for this turn all at once,
+        the AI moves the rest of its units one at a time"""
+        self.played_plan = (player, self.controller.G.turn)
+        moves = player.AI.planned_moves()
+        self.controller.execute_moves(moves)
+        for unit, key in moves:
+            self.place_unit(unit)
+
+    def follow_orders(self, player):
+        """Move the player's units that have goto orders a step along them"""
+        self.followed_orders = (player, self.controller.G.turn)
+        for unit in list(player.units):
+            if unit.goto and unit.moved < unit.move_speed:
+                self.controller.follow_goto(unit)
+                self.place_unit(unit)
+
+    def order_goto(self, unit, pos):
+        """Order the unit to the square at pos, or after the enemy city or
+        unit on it, and take the first step now if it can still move
+
+        A pos off the map, e.g. on the plane's border, is ignored"""
+        xy = (pos[0] // self.image_size, pos[1] // self.image_size)
+        dims = self.controller.G.map.dims
+        if not (0 <= xy[0] <= dims[0] and 0 <= xy[1] <= dims[1]):
+            return
+        there = self.controller.G.occupancy.at(xy)
+        target = there if there is not None and there.owner is not unit.owner else xy
+        self.controller.goto(unit, target)
+        self.next_message = "{} ordered to {}".format(unit.name, xy)
+        if unit.moved < unit.move_speed:
+            self.controller.follow_goto(unit)
+            self.place_unit(unit)
+
     def mainloop(self):
         """The mainloop for the game, expects a controller to manage the game objects"""
         while self.controller.end != True:
@@ -285,12 +328,16 @@ class GameWindow(object):
             last_key_down = None
             if self.controller.G.current_player.AI:
                 #print("AI for {} taking turn.".format(self.controller.G.current_player.name))
+                if self.played_plan != (self.controller.G.current_player, self.controller.G.turn):
+                    self.play_plan(self.controller.G.current_player)
                 msgs =self.controller.G.current_player.AI.next_move()
                 if 'End Turn' in msgs:
                   self.next_turn()
                 elif 'move' in msgs:
                     last_key_down = pygame.event.Event(pygame.KEYDOWN, key=msgs[2], mod=0)
                 pygame.event.clear()
+            elif self.followed_orders != (self.controller.G.current_player, self.controller.G.turn):
+                self.follow_orders(self.controller.G.current_player)
 
             # for m in messages:
             #     if m[1]:
@@ -315,6 +362,11 @@ class GameWindow(object):
             if last_mouse_move:
                 #self.next_message = "Moved to: {}".format(last_mouse_move.pos)
                 pass
+            if last_mouse_down and last_mouse_down.button == 3 and \
+               isinstance(self.selected, BaseObjects.Unit) and self.selected.move_speed:
+                #right click: send the selected unit there, cities cannot move
+                self.order_goto(self.selected, last_mouse_down.pos)
+                last_mouse_down = None
             if last_mouse_down:
                 self.selected = None
                 if self.status_window:
@@ -350,9 +402,7 @@ class GameWindow(object):
                                           K_KP6, K_KP7, K_KP8, K_KP9]:
                     self.controller.move_unit(self.selected, last_key_down.key)
                     if self.selected.plane:
-                        vector = (self.selected.coords[0] * self.image_size - self.selected.plane.rect.x,
-                                  self.selected.coords[1] * self.image_size - self.selected.plane.rect.y)
-                        self.selected.plane.rect.move_ip(vector)
+                        self.place_unit(self.selected)
                         if self.selected.moved >= self.selected.move_speed:
                             self.selected = self.selected.owner.next_to_move(self.selected)
                     else:
@@ -0,0 +1,167 @@
+"""GridMap - A Map whose terrain is stored in a compact numpy array
+
+CodedMap - base for Maps that store interned terrain codes instead of names
+GridMap - a Map holding one byte of terrain code per square
+"""
+
+#     This part of mPyre, a python implementation of the game Empire
+#     Copyright (C) 2019  Robert C. Ramsdell III <rcriii42@gmail.com>
+#
+#     mPyre is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     mPyre is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with mPyre.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Work started on 18 October, 2026
+
+import numpy as np
+
+from BaseObjects import Map
+
+
+class CodedMap(Map):
+    """CodedMap - base for Maps storing terrain as interned uint8 codes
+
+    Subclasses store the codes (see Map.intern for the code table) and
+    provide get(), items() and _terrain_coords(); the rest of the dict
+    interface is built on those, and like Map only reports squares that
+    differ from the default interior."""
+
+    def _check_coords(self, key):
+        """Raise the same errors as Map for invalid coordinates"""
+        if type(key) is not type(self.dims):
+            raise TypeError("Invalid type for map coords: {}".format(key))
+        if not (0 <= key[0] <= self.dims[0] and 0 <= key[1] <= self.dims[1]):
+            raise KeyError("Coordinates out of bounds: {}".format(key))
+
+    def keys(self):
+        return [xy for xy, _ in self.items()]
+
+    def values(self):
+        return [t for _, t in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.items())
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __delitem__(self, key):
+        if self.get(key) is None:
+            raise KeyError(key)
+        self[key] = self.interior
+
+
+class GridMap(CodedMap):
+    """GridMap - a Map backed by a uint8 array of terrain codes
+
+    Terrain names are interned in terrain_names, and codes[x, y] holds the
+    index of the terrain of square (x, y). Every square, edges included, is
+    stored, so lookups are a single index into the array instead of a dict
+    probe plus the edge checks. Terrain queries are numpy scans of the
+    array and count() uses per terrain tallies. The dict interface (items,
+    keys, get, len) still reports only the squares that differ from the
+    default interior, like Map.
+
+    codes may be any C-ordered uint8 array of shape (dims[0] + 1, dims[1] + 1),
+    such as a numpy.memmap, with terrain_names its code table. counts, the
+    number of squares per code, saves a pass over the array if known."""
+
+    def __init__(self, name='The Map', dims=(10,10),
+                 default_interior='plains',
+                 default_edge='edge',
+                 codes=None, terrain_names=None, counts=None):
+        Map.__init__(self, name, dims, default_interior, default_edge)
+        if codes is None:
+            terrain_names = [default_interior, default_edge]
+            codes = np.frombuffer(bytearray(self.shape[0] * self.shape[1]),
+                                  dtype=np.uint8).reshape(self.shape)
+            codes[(0, -1), :] = 1
+            codes[:, (0, -1)] = 1
+        elif codes.shape != self.shape:
+            raise ValueError("Terrain array shape {} does not match dims {}".format(codes.shape,
+                                                                                    dims))
+        self.codes = codes
+        #A flat view for fast single square reads and writes
+        self._flat = memoryview(codes).cast('B')
+        self._init_codes(terrain_names)
+        if counts is None:
+            counts = np.bincount(codes.ravel(), minlength=len(self.terrain_names)).tolist()
+        self._counts = dict(zip(self.terrain_names, counts))
+
+    def __getitem__(self, key):
+        if key in self._code_of:
+            return self._terrain_coords(key)
+        if type(key) is not type(self.dims):
+            raise TypeError("Invalid type for map coords: {}".format(key))
+        if not (0 <= key[0] <= self.dims[0] and 0 <= key[1] <= self.dims[1]):
+            raise KeyError("Coordinates out of bounds: {}".format(key))
+        return self.terrain_names[self._flat[key[0] * self._height + key[1]]]
+
+    def __setitem__(self, key, value):
+        self._check_coords(key)
+        code = self.intern(value)
+        if key[0] in (0, self.dims[0]) or key[1] in (0, self.dims[1]):
+            return  #Edges always read as the edge terrain
+        i = key[0] * self._height + key[1]
+        old_code = self._flat[i]
+        if old_code != code:
+            self._flat[i] = code
+            self._terrain_changed(key, self.terrain_names[old_code], value)
+
+    def code_array(self):
+        """Return the code array itself, see Map.code_array"""
+        return self.codes
+
+    def _build_passability(self, cannot_enter):
+        """Build a passability layer from the code array"""
+        blocked_codes = [self._code_of[t] for t in cannot_enter if t in self._code_of]
+        return bytearray((~np.isin(self.codes, blocked_codes)).astype(np.uint8).tobytes())
+
+    def __copy__(self):
+        return self.__class__(self.name, self.dims, self.interior, self.edge,
+                              codes=np.array(self.codes), terrain_names=self.terrain_names,
+                              counts=[self._counts.get(t, 0) for t in self.terrain_names])
+
+    def _terrain_coords(self, terrain):
+        """Return the coordinates of every square of the given terrain"""
+        xs, ys = np.nonzero(self.codes == self._code_of[terrain])
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def _stored(self):
+        """Return the x and y arrays of interior squares that are not default"""
+        mask = self.codes != self._interior_code
+        mask[(0, -1), :] = False
+        mask[:, (0, -1)] = False
+        return np.nonzero(mask)
+
+    def __len__(self):
+        return len(self._stored()[0])
+
+    def items(self):
+        xs, ys = self._stored()
+        names = self.terrain_names
+        return [((x, y), names[c]) for x, y, c in zip(xs.tolist(),
+                                                      ys.tolist(),
+                                                      self.codes[xs, ys].tolist())]
+
+    def get(self, key, default=None):
+        if type(key) is not type(self.dims):
+            return default
+        if not (0 < key[0] < self.dims[0] and 0 < key[1] < self.dims[1]):
+            return default
+        code = self._flat[key[0] * self._height + key[1]]
+        if code == self._interior_code:
+            return default
+        return self.terrain_names[code]
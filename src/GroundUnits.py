@@ -29,6 +29,16 @@ import Cities
 
 namer = Namer()
 
+#The keypad key that moves a unit one step (dx, dy), see Infantry.move
+direction_keys = {( 0,  1): K_KP2,
+                  ( 1,  1): K_KP3,
+                  ( 1,  0): K_KP6,
+                  ( 1, -1): K_KP9,
+                  ( 0, -1): K_KP8,
+                  (-1, -1): K_KP7,
+                  (-1,  0): K_KP4,
+                  (-1,  1): K_KP1}
+
 class Infantry(Unit):
     """The basic ground unit"""
 
@@ -44,6 +54,7 @@ class Infantry(Unit):
 
         self.moved = 0
         self.move_speed = 1
+        self.goto = None  #a standing GotoOrder, see World.follow_goto
         self.cannot_enter = ['edge', 'water']
 
         self.max_strength = 1
@@ -81,18 +92,18 @@ class Infantry(Unit):
             return False
         new_coords = (self.coords[0]+ move_vector[0],
                       self.coords[1] + move_vector[1])
-        if G.map[new_coords] in self.cannot_enter :
+        if not G.map.can_enter(new_coords, self.cannot_enter):
             #print("{} cannot move into {}".format(self.name, G.map[new_coords]))
             return False
         u = self.check_collision(new_coords, G)
         if not u:
-            self.coords = new_coords
+            G.occupancy.move(self, new_coords)
             self.moved += 1
             return True
         elif u.owner is not self.owner:
             return u
         elif isinstance(u, Cities.City):
-            self.coords = new_coords
+            G.occupancy.move(self, new_coords)
             self.moved += 1
             return True
         else:
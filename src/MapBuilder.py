@@ -20,6 +20,7 @@
 
 import random
 import os
+import numpy as np
 import pygame
 
 from BaseObjects import Namer, Map
@@ -42,23 +43,24 @@ city_name_list = ["Bree", "Chicago", "Hobbiton", "Farmington", "Gotham City", "B
 
 city_namer = Namer(name_list=city_name_list, number_names=False)
 
-def map_builder(size, numcities=False, frac_water=False):
+def map_builder(size, numcities=False, frac_water=False, map_class=Map):
     """Generate a map in the given game
 
     size is the size of the map (x, y) in map coords
     numcities is the number of cities on the map, defaults to one per
      default_city_density squares
-     frac_water is the fraction of the map that is water"""
+     frac_water is the fraction of the map that is water
+     map_class is the Map type to build, e.g. GridMap.GridMap"""
     area = size[0] * size[1]
     if not numcities:
         numcities = int(area / default_city_density +.5)
     if not frac_water:
         frac_water = default_water_frac
 
-    map = Map(dims=size)
+    map = map_class(dims=size)
     while True:
         map = add_water(map, 4)
-        if len(map['water']) >= area * frac_water:
+        if map.count('water') >= area * frac_water:
             break
 
     map, cities = add_cities(map, numcities)
@@ -85,11 +87,11 @@ def add_water(map, min_dia=3):
                 if map[coords] == "plains":
                     map[coords] = "water"
                     water_to_check.append(coords)
-    checked = []
+    checked = set()
     while len(water_to_check) > 0:
         sq = water_to_check.pop()
         #print("checking {} {}".format(sq, map[sq]))
-        for n in [x for x in map.neighbors(sq) if map[x]=='plains' and x not in checked.copy()]:
+        for n in [x for x in map.neighbors(sq) if map[x]=='plains' and x not in checked]:
             #print("checking {} {}, neighbor of {}, {}".format(n, map[n], sq, map[sq]))
             num_plains = sum(1 for ne in map.neighbors(n) if map[ne] in ['plains', 'edge', 'city'])
             if num_plains > 0:
@@ -97,26 +99,29 @@ def add_water(map, min_dia=3):
                 if random.random() < chance_water:
                     map[n] = 'water'
                     water_to_check.append(n)
-            checked.append(n)
+            checked.add(n)
     #Remove singleton water and water whose only neighbor is diagonal
-    for sq in map['water']:
-        if len([s for s in map.neighbors(sq) if map[s]=='water'])==0:
-            map[sq] = 'plains'
-        if len([s for s in map.neighbors(sq) if map[s] == 'water']) == 1:
-            if len([s for s in map.cardinal_neighbors(sq) if map[s] == 'water']) == 0:
-                map[sq] = 'plains'
-
+    remove_stragglers(map, 'water', ['water'], 'plains')
     # Remove singleton plains and plains whose only neighbor is diagonal
-    for sq in map['plains']:
-        if len([s for s in map.neighbors(sq) if map[s] in ['plains', 'city']]) == 0:
-            map[sq] = 'water'
-        if len([s for s in map.neighbors(sq) if map[s] in ['plains',  'city']]) == 1:
-            if len([s for s in map.cardinal_neighbors(sq) if map[s] in ['plains', 'city']]) == 0:
-                map[sq] = 'water'
+    remove_stragglers(map, 'plains', ['plains', 'city'], 'water')
 
     return map
 
 
+def remove_stragglers(map, terrain, joins, replacement):
+    """Replace squares of terrain that have no neighbors in joins, or only a
+    diagonal one, with replacement
+
+    The neighbor counts are array operations over the whole map, see
+    Map.neighbor_counts"""
+    all_joins = map.neighbor_counts(joins)
+    cardinal_joins = map.neighbor_counts(joins, 'cardinal')
+    stragglers = map.terrain_mask([terrain]) & ((all_joins == 0) |
+                                                ((all_joins == 1) & (cardinal_joins == 0)))
+    for x, y in zip(*np.nonzero(stragglers)):
+        map[(int(x), int(y))] = replacement
+
+
 def add_cities(map, numcities):
     """Add cities to the map
 
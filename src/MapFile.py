@@ -0,0 +1,94 @@
+"""MapFile - Save and load maps in a binary format that can be memory mapped
+
+save_map - write a map and its cities to a file
+load_map - open a map file, mapping the terrain array instead of reading it
+
+The file is a fixed header, a JSON block with the terrain table, counts
+and cities, then the raw uint8 terrain codes of every square in x-major
+order, starting on a page boundary so numpy.memmap can map them directly.
+"""
+
+#     This part of mPyre, a python implementation of the game Empire
+#     Copyright (C) 2019  Robert C. Ramsdell III <rcriii42@gmail.com>
+#
+#     mPyre is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     mPyre is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with mPyre.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Work started on 18 October, 2026
+
+import json
+import struct
+
+import numpy as np
+
+from Cities import City
+from GridMap import GridMap
+
+magic = b'mPyreMap'
+file_version = 1
+page_size = 4096
+#magic, version, x dim, y dim, offset of the terrain codes, length of the JSON block
+header_format = '<8sHIIQI'
+header_size = struct.calcsize(header_format)
+
+
+def save_map(path, game_map, cities=()):
+    """Write the map terrain and the names and locations of the cities to path"""
+    if not isinstance(game_map, GridMap):
+        game_map = GridMap.from_map(game_map)
+    meta = {'name': game_map.name,
+            'interior': game_map.interior,
+            'edge': game_map.edge,
+            'terrain_names': game_map.terrain_names,
+            'counts': [game_map.count(t) for t in game_map.terrain_names],
+            'cities': [[c.name, c.coords[0], c.coords[1]] for c in cities]}
+    meta = json.dumps(meta).encode('utf-8')
+    data_offset = -(-(header_size + len(meta)) // page_size) * page_size
+    with open(path, 'wb') as f:
+        f.write(struct.pack(header_format, magic, file_version,
+                            game_map.dims[0], game_map.dims[1],
+                            data_offset, len(meta)))
+        f.write(meta)
+        f.write(bytes(data_offset - header_size - len(meta)))
+        f.write(np.ascontiguousarray(game_map.codes).tobytes())
+
+
+def load_map(path, mode='c', map_class=GridMap):
+    """Open a map file written by save_map
+
+    mode is the numpy.memmap mode for the terrain: 'c' (the default) maps
+    the file copy-on-write so the game can change the map without touching
+    the file, 'r+' writes changes back to the file and 'r' is read only.
+    Only the pages of the terrain that are used get read from disk.
+    map_class other than GridMap copies the terrain into a map of that class.
+
+    Returns the map and a list of neutral cities"""
+    with open(path, 'rb') as f:
+        header = f.read(header_size)
+        if len(header) < header_size or header[:len(magic)] != magic:
+            raise ValueError("Not a map file: {}".format(path))
+        _, version, x_dim, y_dim, data_offset, meta_length = struct.unpack(header_format, header)
+        if version != file_version:
+            raise ValueError("Unsupported map file version {}: {}".format(version, path))
+        meta = json.loads(f.read(meta_length).decode('utf-8'))
+
+    dims = (x_dim, y_dim)
+    codes = np.memmap(path, dtype=np.uint8, mode=mode, offset=data_offset,
+                      shape=(x_dim + 1, y_dim + 1))
+    game_map = GridMap(meta['name'], dims, meta['interior'], meta['edge'],
+                       codes=codes, terrain_names=meta['terrain_names'],
+                       counts=meta['counts'])
+    if map_class is not GridMap:
+        game_map = map_class.from_map(game_map)
+    cities = [City(name, (x, y)) for name, x, y in meta['cities']]
+    return game_map, cities
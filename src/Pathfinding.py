@@ -0,0 +1,1709 @@
+"""Pathfinding - Route finding across a Map
+
+a_star - A* search using a binary heap for the open set
+budgeted_a_star - a_star limited to a number of expansions or a deadline, with partial paths
+jps - Jump Point Search, A* that skips the symmetric routes of open ground
+bidirectional_a_star - A* from both ends at once, for long routes
+auto_path - bidirectional_a_star for long routes, a_star for short ones
+LandmarkTable - distances from a few landmarks, for the ALT lower bounds of alt_star
+alt_star - A* with the landmark lower bounds as well as the straight line distance
+hpa_star - hierarchical A*, routes over a ClusterGraph and refines the legs into squares
+ClusterGraph - the cluster entrances and distances of a Map for hpa_star
+find_path - find a path with the pathfinder chosen by name
+find_paths - find the paths for a batch of requests on a process pool
+distance_field - the number of steps from every square to a goal
+wavefront - distances and directions from every square to the nearest of many sources, in numpy
+nearest_targets - one search for the nearest few of many targets
+FlowFields - distance fields shared by all the units heading for a target
+PathCache - a least recently used cache of find_path results
+DStarLite - an incremental planner that repairs its plan as squares open and close
+ReservationTable - the squares units hold at each time step of a cooperative plan
+cooperative_paths - plan the moves of a group of units together (WHCA*)
+GotoOrder - a standing order to move to a target, keeping its route between steps
+reconstruct_path - rebuild a path from a dictionary of parent coordinates
+PathStats - statistics of the searches made while recording, see enable_stats
+"""
+
+#     This part of mPyre, a python implementation of the game Empire
+#     Copyright (C) 2019  Robert C. Ramsdell III <rcriii42@gmail.com>
+#
+#     mPyre is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     mPyre is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with mPyre.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Work started on 18 October, 2026
+
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import functools
+from heapq import heappush, heappop
+import json
+import os
+import time
+
+import numpy as np
+
+unknown_score = 999999999  #g score of squares the search has not reached
+#budgeted_a_star results
+path_found = 'found'
+path_partial = 'partial'
+no_route = 'no route'
+deadline_check_interval = 64  #expansions between the budgeted searches' checks of the clock
+dense_search_limit = 1 << 20  #maps with more squares than this use sparse search arrays
+default_cluster_size = 16  #width and height of a ClusterGraph cluster in squares
+default_path_cache_size = 1024  #paths a PathCache keeps
+parallel_batch_size = 16  #smaller find_paths batches run in this process
+default_plan_window = 8  #time steps cooperative_paths plans ahead
+#The steps a GotoOrder stores its route as, by code
+direction_steps = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+direction_codes = dict((step, code) for code, step in enumerate(direction_steps))
+no_direction = 255  #the wavefront parent of sources and of the squares it does not reach
+default_landmarks = 8  #landmarks in a LandmarkTable
+alt_goals_kept = 8  #goals a LandmarkTable keeps the lower bounds of
+bidirectional_distance = 32  #auto_path searches from both ends for routes at least this long
+wide_entrance = 6  #entrances at least this wide get a crossing at each end, narrower ones one in the middle
+
+
+class SparseArray(dict):
+    """A dict standing in for a per square list on maps too big to allocate one per search"""
+
+    def __init__(self, default):
+        self.default = default
+
+    def __missing__(self, key):
+        return self.default
+
+
+def search_array(size, default):
+    """Return a per square array for a search holding default for every square
+
+    Maps up to dense_search_limit squares get a list (or a bytearray for a
+    default of 0), bigger ones a SparseArray that only stores the squares
+    the search touches."""
+    if size > dense_search_limit:
+        return SparseArray(default)
+    if default == 0:
+        return bytearray(size)
+    return [default] * size
+
+
+stats = None  #the PathStats searches are recorded in, None when not recording
+_query = None  #the counters of the search being recorded
+
+
+def enable_stats():
+    """Start recording searches, returns the PathStats they go in"""
+    global stats
+    if stats is None:
+        stats = PathStats()
+    return stats
+
+
+def disable_stats():
+    """Stop recording searches, returns the PathStats recorded so far"""
+    global stats
+    recorded, stats = stats, None
+    return recorded
+
+
+class PathStats(object):
+    """PathStats - a record of the searches made while recording is on
+
+    Each search is a dict with its kind (the search function, or 'cache'
+    for a PathCache lookup) and, as they apply: expanded, the squares or
+    nodes expanded; peak_open, the most entries in the open set (or the
+    widest frontier of a breadth first search) at once, None if neither;
+    length, the squares in the path found (0 for none); status, as for
+    budgeted_a_star; seconds, the wall time; hit, whether a cache lookup
+    found its path. When recording is off (stats is None) each search
+    costs a check of stats, nothing per square."""
+
+    def __init__(self):
+        self.queries = []
+
+    def record(self, query):
+        self.queries.append(query)
+
+    def clear(self):
+        self.queries = []
+
+    def kinds(self):
+        """Return the kinds of search recorded"""
+        return sorted(set(q['kind'] for q in self.queries))
+
+    def values(self, field, kind=None):
+        """Return the recorded values of field, of searches of the given kind or all"""
+        return [q[field] for q in self.queries
+                if field in q and q[field] is not None and kind in (None, q['kind'])]
+
+    def percentiles(self, field, kind=None, points=(50, 90, 99)):
+        """Return a dict of the given percentiles of field, and its count,
+        total and max, for searches of the given kind or all"""
+        values = self.values(field, kind)
+        if not values:
+            return {'count': 0}
+        summary = dict(('p{}'.format(p), float(v))
+                       for p, v in zip(points, np.percentile(values, points)))
+        summary.update(count=len(values), total=sum(values), max=max(values))
+        return summary
+
+    def summary(self):
+        """Return the percentiles of each field for each kind of search, and
+        the hit rate of cache lookups"""
+        summary = {}
+        for kind in self.kinds():
+            queries = [q for q in self.queries if q['kind'] == kind]
+            fields = set(f for q in queries for f in q) - {'kind', 'status', 'hit'}
+            summary[kind] = dict((f, self.percentiles(f, kind)) for f in sorted(fields))
+            summary[kind]['count'] = len(queries)
+            hits = [q['hit'] for q in queries if 'hit' in q]
+            if hits:
+                summary[kind]['hit_rate'] = sum(hits) / len(hits)
+        return summary
+
+    def dump(self, path):
+        """Append the recorded searches to the file at path, one JSON object per line"""
+        with open(path, 'a') as f:
+            for q in self.queries:
+                f.write(json.dumps(q) + '\n')
+
+
+class Query(object):
+    """The counters of one search being recorded"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.peak_open = None  #set by searches with an open set or frontier
+        self.closed = ()  #the search's closed arrays or sets, counted at the end
+        self.expanded = None  #or set by searches that have no closed array
+
+    def push(self, heap, item):
+        """heappush, keeping track of the largest size of the heap"""
+        heappush(heap, item)
+        if len(heap) > self.peak_open:
+            self.peak_open = len(heap)
+
+    def entry(self, result, seconds, returns_path):
+        """Return the dict to record for the search, given its result"""
+        expanded = self.expanded
+        if expanded is None:
+            expanded = sum(c.count(1) if isinstance(c, bytearray) else len(c) for c in self.closed)
+        entry = {'kind': self.kind, 'expanded': expanded, 'peak_open': self.peak_open,
+                 'seconds': seconds}
+        if returns_path:
+            status, path = result if isinstance(result, tuple) else (None, result)
+            entry['length'] = len(path) if path else 0
+            entry['status'] = status or (path_found if path else no_route)
+        return entry
+
+
+def _recording(*closed):
+    """Return the heappush for a search to use, and if it is being recorded
+    note its closed arrays or sets, to count its expansions at the end"""
+    if _query is None:
+        return heappush
+    _query.closed = closed
+    _query.peak_open = 0
+    return _query.push
+
+
+def recorded(kind, returns_path=True):
+    """Decorator for a search function, recording each call in stats while it is not None
+
+    returns_path is False for searches whose result is not a path, or a
+    status and path, so they get no length or status"""
+    def decorate(search):
+        @functools.wraps(search)
+        def recorded_search(*args, **kwargs):
+            global _query
+            if stats is None:
+                return search(*args, **kwargs)
+            outer, _query = _query, Query(kind)
+            began = time.perf_counter()
+            try:
+                result = search(*args, **kwargs)
+            finally:
+                query, _query = _query, outer
+            if stats is not None:
+                stats.record(query.entry(result, time.perf_counter() - began, returns_path))
+            return result
+        return recorded_search
+    return decorate
+
+
+def ch_distance(xy1, xy2):
+    """The cherbychev distance between to points"""
+    return max(abs(xy1[0] - xy2[0]),
+               abs(xy1[1] - xy2[1]))
+
+
+def reconstruct_path(came_from, current):
+    """reconstruct the path
+
+    current is the end point
+    came_from is dict whose keys are coordinates and values are the previous coordinates"""
+    total_path = [current]
+    while current in came_from.keys():
+        current = came_from[current]
+        total_path.append(current)
+    total_path.reverse()
+    return total_path
+
+
+def flat_path(came_from, current, height):
+    """reconstruct a path from flat square indices
+
+    current is the flat index of the end point
+    came_from is a list holding the flat index of the previous square, or -1
+    height is the number of squares in a map column (dims[1] + 1)"""
+    total_path = []
+    while current >= 0:
+        total_path.append(divmod(current, height))
+        current = came_from[current]
+    total_path.reverse()
+    return total_path
+
+
+def a_star(start, goal, game_map,
+           cannot_enter=['edge', 'water'], bounds=None):
+    """A* finds a path from the units location to goal.
+
+    start and goal are 2D coordinates
+    game_map is the map object with terrain.
+    cannot_enter is a list of impassible terrain
+    bounds is an optional per square list of lower bounds on the distance
+    to goal, used with the straight line distance (see alt_star)
+
+    The open set is a heap ordered on f score, ties going to the square
+    closest to the goal. G scores, parents and the closed set are flat lists
+    indexed by x * (dims[1] + 1) + y (see search_array for very large maps),
+    so nothing is scanned per expansion.
+    Neighbors and passability come from the map's neighbor table and
+    passability layer for cannot_enter.
+    A goal in another connected component (see Map.same_component), e.g.
+    on another island, is rejected without searching.
+    The search has no limit, see budgeted_a_star for one that has.
+
+    Returns the list of coordinates from start to goal, or False if there
+    is no route.
+
+    from the wiki page: https://en.wikipedia.org/wiki/A*_search_algorithm"""
+    status, path = budgeted_a_star(start, goal, game_map, cannot_enter, bounds=bounds)
+    return path if status == path_found else False
+
+
+@recorded('a_star')
+def budgeted_a_star(start, goal, game_map, cannot_enter=['edge', 'water'],
+                    max_nodes=None, deadline=None, bounds=None):
+    """a_star that stops after expanding max_nodes squares, or at deadline,
+    a time.monotonic() time, whichever comes first (neither by default)
+
+    Returns a status and a path:
+    path_found and the path from start to goal,
+    path_partial and the path to the square closest to goal (lowest h)
+    expanded before the budget ran out, for a unit to move along while
+    the search is finished later,
+    no_route and the path to the square closest to goal, or False if the
+    goal is in another connected component.
+    The deadline is checked every deadline_check_interval expansions."""
+    if not game_map.same_component(start, goal, cannot_enter):
+        return no_route, False
+    height = game_map.dims[1] + 1
+    size = (game_map.dims[0] + 1) * height
+    passable = game_map.passability(cannot_enter)
+    neighbors = game_map.flat_neighbors
+    gx, gy = goal
+    start_i = start[0] * height + start[1]
+    goal_i = gx * height + gy
+    if max_nodes is None:
+        max_nodes = unknown_score
+
+    #For square i, g_score[i] is the cost of the cheapest path from start to i currently known.
+    g_score = search_array(size, unknown_score)
+    g_score[start_i] = 0
+    #For square i, came_from[i] is the square preceding it on that path
+    came_from = search_array(size, -1)
+    closed = search_array(size, 0)
+    push = _recording(closed)
+
+    h = max(abs(start[0] - gx), abs(start[1] - gy))
+    # Entries are (f score, h score, flat index), the index breaks ties
+    open_heap = [(h, h, start_i)]
+    best_h, best = h, start_i  #the expanded square closest to goal
+    expanded = 0
+
+    while open_heap:
+        _, h, current = heappop(open_heap)
+        if closed[current]:
+            continue  #stale entry, the square was already expanded
+        if current == goal_i:
+            return path_found, flat_path(came_from, current, height)
+        closed[current] = 1
+        if h < best_h:
+            best_h, best = h, current
+        expanded += 1
+        if expanded >= max_nodes or (deadline is not None and not expanded % deadline_check_interval
+                                     and time.monotonic() >= deadline):
+            return path_partial, flat_path(came_from, best, height)
+
+        tentative_g_score = g_score[current] + 1
+        for neighbor in neighbors(current):
+            if closed[neighbor] or tentative_g_score >= g_score[neighbor] or not passable[neighbor]:
+                continue
+            #This path to neighbor is better than any previous one. Record it!
+            came_from[neighbor] = current
+            g_score[neighbor] = tentative_g_score
+            x, y = divmod(neighbor, height)
+            h = max(abs(x - gx), abs(y - gy))
+            if bounds is not None and bounds[neighbor] > h:
+                h = bounds[neighbor]
+            push(open_heap, (tentative_g_score + h, h, neighbor))
+    #open_set is empty but goal was never reached
+    return no_route, flat_path(came_from, best, height)
+
+
+def sign(n):
+    """Return -1, 0 or 1 for the sign of n"""
+    return (n > 0) - (n < 0)
+
+
+def expand_jumps(points):
+    """Fill in the squares between the jump points of a path
+
+    Consecutive points must lie on a straight or diagonal line"""
+    path = [points[0]]
+    for x1, y1 in points[1:]:
+        x, y = path[-1]
+        dx, dy = sign(x1 - x), sign(y1 - y)
+        while (x, y) != (x1, y1):
+            x += dx
+            y += dy
+            path.append((x, y))
+    return path
+
+
+@recorded('jps')
+def jps(start, goal, game_map,
+        cannot_enter=['edge', 'water']):
+    """Jump Point Search finds a path from start to goal.
+
+    Takes the same arguments and returns the same path (every square from
+    start to goal, or False) as a_star.
+
+    Every step costs 1, so open ground has many equally short routes and
+    A* expands all of them. JPS only expands jump points: from each square
+    it walks straight and diagonal lines, pruning the squares a shorter or
+    equal route reaches without it, until the goal or a square with a
+    forced neighbor (one only reachable around an obstacle). Long marches
+    over open ground then expand a handful of squares instead of every
+    square in the cone towards the goal.
+
+    Diagonal moves past blocked corners are allowed, as in a_star.
+
+    from Harabor and Grastien, Online Graph Pruning for Pathfinding on Grid
+    Maps, AAAI 2011"""
+    if not game_map.same_component(start, goal, cannot_enter):
+        return False
+    max_x, max_y = game_map.dims
+    height = max_y + 1
+    size = (max_x + 1) * height
+    passable = game_map.passability(cannot_enter)
+    gx, gy = goal
+    start_i = start[0] * height + start[1]
+    goal_i = gx * height + gy
+
+    def ok(x, y):
+        return 0 <= x <= max_x and 0 <= y <= max_y and passable[x * height + y]
+
+    def jump_straight(x, y, dx, dy):
+        """Walk from x, y in a cardinal direction, return the next jump point or None
+
+        Works on flat indices, the squares beside the line are i - side and
+        i + side, and are only looked at when they are on the map"""
+        i = x * height + y
+        if dx:
+            step, side = dx * height, 1
+            low, high = y > 0, y < max_y
+        else:
+            step, side = dy, height
+            low, high = x > 0, x < max_x
+        while True:
+            x += dx
+            y += dy
+            if not (0 <= x <= max_x and 0 <= y <= max_y):
+                return None
+            i += step
+            if not passable[i]:
+                return None
+            if i == goal_i:
+                return x, y
+            if 0 <= x + dx <= max_x and 0 <= y + dy <= max_y:
+                if high and not passable[i + side] and passable[i + step + side]:
+                    return x, y
+                if low and not passable[i - side] and passable[i + step - side]:
+                    return x, y
+
+    def jump(x, y, dx, dy):
+        """Walk from x, y in any direction, return the next jump point or None"""
+        if not (dx and dy):
+            return jump_straight(x, y, dx, dy)
+        i = x * height + y
+        across = dx * height
+        while True:
+            x += dx
+            y += dy
+            if not (0 <= x <= max_x and 0 <= y <= max_y):
+                return None
+            i += across + dy
+            if not passable[i]:
+                return None
+            if i == goal_i:
+                return x, y
+            #The squares behind x and y are on the map, the ones ahead may not be
+            if 0 <= y + dy <= max_y and not passable[i - across] and passable[i - across + dy]:
+                return x, y
+            if 0 <= x + dx <= max_x and not passable[i - dy] and passable[i + across - dy]:
+                return x, y
+            if jump_straight(x, y, dx, 0) or jump_straight(x, y, 0, dy):
+                return x, y
+
+    def directions(x, y, parent):
+        """Return the directions to search from x, y after arriving from parent"""
+        if parent < 0:
+            return [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+        px, py = divmod(parent, height)
+        dx, dy = sign(x - px), sign(y - py)
+        if dx and dy:
+            dirs = [(dx, dy), (dx, 0), (0, dy)]
+            if not ok(x - dx, y):
+                dirs.append((-dx, dy))
+            if not ok(x, y - dy):
+                dirs.append((dx, -dy))
+        elif dx:
+            dirs = [(dx, 0)]
+            if not ok(x, y + 1):
+                dirs.append((dx, 1))
+            if not ok(x, y - 1):
+                dirs.append((dx, -1))
+        else:
+            dirs = [(0, dy)]
+            if not ok(x + 1, y):
+                dirs.append((1, dy))
+            if not ok(x - 1, y):
+                dirs.append((-1, dy))
+        return dirs
+
+    #g_score and came_from as in a_star, but only jump points are recorded
+    g_score = search_array(size, unknown_score)
+    g_score[start_i] = 0
+    came_from = search_array(size, -1)
+    closed = search_array(size, 0)
+    push = _recording(closed)
+
+    h = max(abs(start[0] - gx), abs(start[1] - gy))
+    open_heap = [(h, h, start_i)]
+
+    while open_heap:
+        _, _, current = heappop(open_heap)
+        if closed[current]:
+            continue
+        if current == goal_i:
+            return expand_jumps(flat_path(came_from, current, height))
+        closed[current] = 1
+
+        x, y = divmod(current, height)
+        for dx, dy in directions(x, y, came_from[current]):
+            point = jump(x, y, dx, dy)
+            if point is None:
+                continue
+            jx, jy = point
+            neighbor = jx * height + jy
+            tentative_g_score = g_score[current] + max(abs(jx - x), abs(jy - y))
+            if closed[neighbor] or tentative_g_score >= g_score[neighbor]:
+                continue
+            came_from[neighbor] = current
+            g_score[neighbor] = tentative_g_score
+            h = max(abs(jx - gx), abs(jy - gy))
+            push(open_heap, (tentative_g_score + h, h, neighbor))
+    return False
+
+
+class ClusterGraph(object):
+    """ClusterGraph - the abstract graph hpa_star searches
+
+    The map is cut into cluster_size x cluster_size clusters. Where a run of
+    squares along the boundary of two clusters is passable on both sides,
+    one or two crossings are placed; their squares are the graph's nodes,
+    joined across the boundary by a step of cost 1 and, inside a cluster, to
+    every other node of the cluster by the length of the shortest route
+    that stays in the cluster. Nodes are flat indices as in a_star.
+
+    The Map calls terrain_changed for each write, which marks the square's
+    cluster dirty, along with the boundary and the cluster across it if the
+    square is on a boundary. refresh() then rebuilds only those, so a
+    terrain change costs a few cluster searches instead of a new graph.
+
+    Crossings are straight steps, so clusters only joined by a diagonal
+    step, or at a corner, are not connected in the graph; hpa_star falls
+    back to a_star when the graph has no route."""
+
+    def __init__(self, game_map, cannot_enter, cluster_size=default_cluster_size):
+        self.map = game_map
+        self.cannot_enter = frozenset(cannot_enter)
+        self.size = cluster_size
+        self.height = game_map.dims[1] + 1
+        self.num_clusters = (game_map.dims[0] // cluster_size + 1,
+                             game_map.dims[1] // cluster_size + 1)
+        #Boundary ((cx, cy), 0) is between clusters (cx, cy) and (cx + 1, cy),
+        #((cx, cy), 1) between (cx, cy) and (cx, cy + 1)
+        self.entrances = {}  #boundary: list of (node, node across) pairs
+        self.across = {}  #node: list of the nodes one step away in other clusters
+        self.intra = {}  #cluster: {node: {other node: distance}}
+        self.rebuilds = 0  #number of cluster rebuilds so far
+        clusters = [(cx, cy) for cx in range(self.num_clusters[0]) for cy in range(self.num_clusters[1])]
+        self.dirty_clusters = set(clusters)
+        self.dirty_boundaries = set([(k, 0) for k in clusters if k[0] + 1 < self.num_clusters[0]] +
+                                    [(k, 1) for k in clusters if k[1] + 1 < self.num_clusters[1]])
+
+    def cluster_of(self, i):
+        """Return the cluster of the square with flat index i"""
+        x, y = divmod(i, self.height)
+        return x // self.size, y // self.size
+
+    def bounds(self, cluster):
+        """Return the first and last x and y of the given cluster"""
+        x0, y0 = cluster[0] * self.size, cluster[1] * self.size
+        return (x0, y0, min(x0 + self.size - 1, self.map.dims[0]),
+                min(y0 + self.size - 1, self.map.dims[1]))
+
+    def terrain_changed(self, key, old, new):
+        """Mark the clusters and boundaries a change of square key affects"""
+        if (old in self.cannot_enter) == (new in self.cannot_enter):
+            return
+        x, y = key
+        cx, cy = x // self.size, y // self.size
+        self.dirty_clusters.add((cx, cy))
+        if x % self.size == self.size - 1 and cx + 1 < self.num_clusters[0]:
+            self.dirty_boundaries.add(((cx, cy), 0))
+            self.dirty_clusters.add((cx + 1, cy))
+        if x % self.size == 0 and cx > 0:
+            self.dirty_boundaries.add(((cx - 1, cy), 0))
+            self.dirty_clusters.add((cx - 1, cy))
+        if y % self.size == self.size - 1 and cy + 1 < self.num_clusters[1]:
+            self.dirty_boundaries.add(((cx, cy), 1))
+            self.dirty_clusters.add((cx, cy + 1))
+        if y % self.size == 0 and cy > 0:
+            self.dirty_boundaries.add(((cx, cy - 1), 1))
+            self.dirty_clusters.add((cx, cy - 1))
+
+    def refresh(self):
+        """Rebuild the dirty boundaries and clusters"""
+        if not (self.dirty_boundaries or self.dirty_clusters):
+            return
+        passable = self.map.passability(self.cannot_enter)
+        for boundary in self.dirty_boundaries:
+            for a, b in self.entrances.get(boundary, []):
+                for node, other in ((a, b), (b, a)):
+                    self.across[node].remove(other)
+                    if not self.across[node]:
+                        del self.across[node]
+            self.entrances[boundary] = self.find_entrances(boundary, passable)
+            for a, b in self.entrances[boundary]:
+                self.across.setdefault(a, []).append(b)
+                self.across.setdefault(b, []).append(a)
+        self.dirty_boundaries = set()
+        for cluster in self.dirty_clusters:
+            nodes = self.cluster_nodes(cluster)
+            self.intra[cluster] = {n: self.cluster_distances(cluster, n, nodes, passable) for n in nodes}
+            self.rebuilds += 1
+        self.dirty_clusters = set()
+
+    def find_entrances(self, boundary, passable):
+        """Return the crossings of the given boundary as (node, node across) pairs"""
+        (cx, cy), side = boundary
+        height = self.height
+        x0, y0, x1, y1 = self.bounds((cx, cy))
+        if side == 0:
+            pairs = [(x1 * height + y, (x1 + 1) * height + y) for y in range(y0, y1 + 1)]
+        else:
+            pairs = [(x * height + y1, x * height + y1 + 1) for x in range(x0, x1 + 1)]
+        entrances = []
+        run = []
+        for a, b in pairs + [(None, None)]:
+            if a is not None and passable[a] and passable[b]:
+                run.append((a, b))
+                continue
+            if len(run) >= wide_entrance:
+                entrances.extend([run[0], run[-1]])
+            elif run:
+                entrances.append(run[len(run) // 2])
+            run = []
+        return entrances
+
+    def cluster_nodes(self, cluster):
+        """Return the set of nodes in the given cluster"""
+        cx, cy = cluster
+        nodes = set(a for a, b in self.entrances.get(((cx, cy), 0), []))
+        nodes.update(a for a, b in self.entrances.get(((cx, cy), 1), []))
+        nodes.update(b for a, b in self.entrances.get(((cx - 1, cy), 0), []))
+        nodes.update(b for a, b in self.entrances.get(((cx, cy - 1), 1), []))
+        return nodes
+
+    def cluster_distances(self, cluster, source, targets, passable):
+        """Return {target: distance} for the targets a breadth first search
+        from source reaches without leaving the cluster"""
+        x0, y0, x1, y1 = self.bounds(cluster)
+        height = self.height
+        neighbors = self.map.flat_neighbors
+        distance = {source: 0}
+        frontier = [source]
+        steps = 0
+        while frontier:
+            steps += 1
+            next_frontier = []
+            for i in frontier:
+                for n in neighbors(i):
+                    if n in distance or not passable[n]:
+                        continue
+                    x, y = divmod(n, height)
+                    if x0 <= x <= x1 and y0 <= y <= y1:
+                        distance[n] = steps
+                        next_frontier.append(n)
+            frontier = next_frontier
+        return {t: distance[t] for t in targets if t in distance and t != source}
+
+    def route(self, start_i, goal_i):
+        """Return the flat indices of the nodes on the shortest route through
+        the graph from start_i to goal_i, both included, or None"""
+        self.refresh()
+        passable = self.map.passability(self.cannot_enter)
+        start_cluster, goal_cluster = self.cluster_of(start_i), self.cluster_of(goal_i)
+        targets = self.cluster_nodes(start_cluster)
+        if start_cluster == goal_cluster:
+            targets.add(goal_i)
+        from_start = self.cluster_distances(start_cluster, start_i, targets, passable)
+        to_goal = self.cluster_distances(goal_cluster, goal_i, self.cluster_nodes(goal_cluster), passable)
+        height = self.height
+        gx, gy = divmod(goal_i, height)
+
+        g_score = {start_i: 0}
+        came_from = {start_i: -1}
+        closed = set()
+        push = _recording(closed)
+        h = max(abs(start_i // height - gx), abs(start_i % height - gy))
+        open_heap = [(h, h, start_i)]
+        while open_heap:
+            _, _, current = heappop(open_heap)
+            if current in closed:
+                continue
+            if current == goal_i:
+                route = []
+                while current >= 0:
+                    route.append(current)
+                    current = came_from[current]
+                route.reverse()
+                return route
+            closed.add(current)
+            if current == start_i:
+                edges = list(from_start.items())
+            else:
+                edges = list(self.intra[self.cluster_of(current)].get(current, {}).items())
+                if current in to_goal:
+                    edges.append((goal_i, to_goal[current]))
+            edges.extend((n, 1) for n in self.across.get(current, []))
+            for neighbor, cost in edges:
+                tentative_g_score = g_score[current] + cost
+                if neighbor in closed or tentative_g_score >= g_score.get(neighbor, unknown_score):
+                    continue
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g_score
+                x, y = divmod(neighbor, height)
+                h = max(abs(x - gx), abs(y - gy))
+                push(open_heap, (tentative_g_score + h, h, neighbor))
+        return None
+
+
+@recorded('hpa')
+def hpa_star(start, goal, game_map,
+             cannot_enter=['edge', 'water'],
+             refine=None, cluster_size=default_cluster_size):
+    """Hierarchical A* finds a route from start to goal over the map's
+    ClusterGraph and refines its legs into squares.
+
+    Takes the same first arguments as a_star. refine is the number of legs
+    (between graph nodes) to refine with a_star, None (the default) for all
+    of them, which returns every square from start to goal like a_star.
+    Otherwise the refined squares are followed by the coordinates of the
+    remaining nodes through to goal: with refine=1 the path is only good
+    for its first steps, which is all a unit moving this turn needs, and a
+    cross-map route costs a graph search plus one search inside a cluster.
+    Returns False if there is no route.
+
+    Routes of at most cluster_size squares, and those the graph cannot
+    find (see ClusterGraph), go to a_star. The graph is kept by the map per
+    cannot_enter and cluster_size; on a MapOverlay it is the base map's, so
+    only the refined legs see the overlay's changes. Routes are close to,
+    but not always, the shortest.
+
+    from Botea, Mueller and Schaeffer, Near Optimal Hierarchical
+    Path-Finding, Journal of Game Development 2004"""
+    if not game_map.same_component(start, goal, cannot_enter):
+        return False
+    if max(abs(start[0] - goal[0]), abs(start[1] - goal[1])) <= cluster_size:
+        return a_star(start, goal, game_map, cannot_enter)
+    height = game_map.dims[1] + 1
+    graph = game_map.cluster_graph(cannot_enter, cluster_size)
+    route = graph.route(start[0] * height + start[1], goal[0] * height + goal[1])
+    if route is None:
+        return a_star(start, goal, game_map, cannot_enter)
+    points = [divmod(i, height) for i in route]
+    path = [start]
+    for leg, (a, b) in enumerate(zip(points, points[1:])):
+        if refine is not None and leg >= refine:
+            path.extend(points[leg + 1:])
+            break
+        steps = a_star(a, b, game_map, cannot_enter)
+        if not steps:
+            #a square on the route is blocked in the overlay
+            return a_star(start, goal, game_map, cannot_enter)
+        path.extend(steps[1:])
+    return path
+
+
+@recorded('bidirectional')
+def bidirectional_a_star(start, goal, game_map,
+                         cannot_enter=['edge', 'water']):
+    """Bidirectional A* finds a path from start to goal by searching forward
+    from start and backward from goal at once.
+
+    Takes the same arguments and returns the same path as a_star. The side
+    with the smaller open set expands next. Whenever a square reached by one
+    side is reached by the other, the route through it is a candidate, and
+    the search stops once either side's smallest f score is at least the
+    best candidate's length: with a consistent heuristic every route still
+    open is at least that long, so the best candidate is a shortest route.
+    Each side only explores about half as far as a_star does on long routes
+    across cluttered ground."""
+    if not game_map.same_component(start, goal, cannot_enter):
+        return False
+    height = game_map.dims[1] + 1
+    size = (game_map.dims[0] + 1) * height
+    passable = game_map.passability(cannot_enter)
+    neighbors = game_map.flat_neighbors
+    start_i = start[0] * height + start[1]
+    goal_i = goal[0] * height + goal[1]
+    if start_i == goal_i:
+        return [start]
+    if not passable[goal_i]:
+        #e.g. blocked in a MapOverlay, which same_component answers for from the base map
+        return False
+
+    #Index 0 is the forward search from start, 1 the backward one from goal
+    g_scores = (search_array(size, unknown_score), search_array(size, unknown_score))
+    came_froms = (search_array(size, -1), search_array(size, -1))
+    closeds = (search_array(size, 0), search_array(size, 0))
+    push = _recording(*closeds)
+    ends = (divmod(goal_i, height), divmod(start_i, height))  #what each side heads for
+    g_scores[0][start_i] = 0
+    g_scores[1][goal_i] = 0
+    h = ch_distance(start, goal)
+    open_heaps = ([(h, h, start_i)], [(h, h, goal_i)])
+    best_length, meeting = unknown_score, -1
+
+    while open_heaps[0] and open_heaps[1]:
+        if open_heaps[0][0][0] >= best_length or open_heaps[1][0][0] >= best_length:
+            break
+        side = 0 if len(open_heaps[0]) <= len(open_heaps[1]) else 1
+        g_score, came_from, closed = g_scores[side], came_froms[side], closeds[side]
+        other_g_score = g_scores[1 - side]
+        ex, ey = ends[side]
+        _, _, current = heappop(open_heaps[side])
+        if closed[current]:
+            continue
+        closed[current] = 1
+        tentative_g_score = g_score[current] + 1
+        for neighbor in neighbors(current):
+            #Forward steps enter neighbor; backward ones leave it, and every
+            #square but the start is entered on the way
+            if not passable[neighbor] and not (side and neighbor == start_i):
+                continue
+            if closed[neighbor] or tentative_g_score >= g_score[neighbor]:
+                continue
+            came_from[neighbor] = current
+            g_score[neighbor] = tentative_g_score
+            if tentative_g_score + other_g_score[neighbor] < best_length:
+                best_length = tentative_g_score + other_g_score[neighbor]
+                meeting = neighbor
+            x, y = divmod(neighbor, height)
+            h = max(abs(x - ex), abs(y - ey))
+            push(open_heaps[side], (tentative_g_score + h, h, neighbor))
+
+    if meeting < 0:
+        return False
+    total_path = flat_path(came_froms[0], meeting, height)
+    current = came_froms[1][meeting]
+    while current >= 0:
+        total_path.append(divmod(current, height))
+        current = came_froms[1][current]
+    return total_path
+
+
+def auto_path(start, goal, game_map,
+              cannot_enter=['edge', 'water']):
+    """Find a path with bidirectional_a_star if start and goal are at least
+    bidirectional_distance apart, otherwise with a_star"""
+    if ch_distance(start, goal) >= bidirectional_distance:
+        return bidirectional_a_star(start, goal, game_map, cannot_enter)
+    return a_star(start, goal, game_map, cannot_enter)
+
+
+class LandmarkTable(object):
+    """LandmarkTable - the distances from a few landmark squares to every
+    square, for the ALT lower bounds of alt_star
+
+    By the triangle inequality a route from square n to goal is at least
+    |d(L, goal) - d(L, n)| long for any landmark L, which, unlike the
+    straight line distance, counts the way around lakes and coastlines.
+    The landmarks are shared out between the connected components (see
+    Map.components) by size, islands too small for a share getting none,
+    and chosen farthest first within each: a landmark is the candidate
+    square farthest from the ones chosen so far, starting from the one
+    farthest from the component's first candidate. Candidates are the
+    component's cities if it has any, otherwise all its squares. The
+    distances come from one wavefront per landmark and are kept as a
+    (landmarks, squares) int32 array; see Map.landmark_table for when they
+    are rebuilt.
+
+    from Goldberg and Harrelson, Computing the shortest path: A* search
+    meets graph theory, SODA 2005"""
+
+    def __init__(self, game_map, cannot_enter=['edge', 'water'], num_landmarks=default_landmarks):
+        passable = game_map.passable_array(cannot_enter)
+        labels = game_map.components(cannot_enter)
+        cities = game_map.terrain_mask(['city']) if 'city' in game_map.terrain else passable & False
+        sizes = np.bincount(labels.ravel())
+        sizes[0] = 0
+        by_size = np.argsort(sizes)[::-1]
+        shares = num_landmarks * sizes // max(sizes.sum(), 1)
+        shares[by_size[0]] += num_landmarks - shares.sum()
+        self.landmarks = []
+        distances = []
+        for label in by_size:
+            if not shares[label]:
+                break
+            candidates = labels == label
+            if (candidates & cities).any():
+                candidates &= cities
+            first = divmod(int(candidates.argmax()), passable.shape[1])
+            nearest = wavefront([first], passable)[0]
+            for n in range(shares[label]):
+                far = np.where(candidates, nearest, -1)
+                i = int(far.argmax())
+                if far.flat[i] <= 0 and self.landmarks:
+                    break  #every candidate is a landmark
+                landmark = divmod(i, passable.shape[1])
+                distance = wavefront([landmark], passable)[0]
+                self.landmarks.append(landmark)
+                distances.append(distance.ravel())
+                nearest = distance if n == 0 else np.minimum(nearest, distance)
+        self.distances = np.array(distances, dtype=np.int32).reshape(len(distances), -1)
+        self.height = passable.shape[1]
+        self.goal_bounds = OrderedDict()
+
+    def bounds(self, goal):
+        """Return a per square list of lower bounds on the distance to goal
+
+        The bounds of the last alt_goals_kept goals are kept."""
+        goal_i = goal[0] * self.height + goal[1]
+        bounds = self.goal_bounds.get(goal_i)
+        if bounds is not None:
+            self.goal_bounds.move_to_end(goal_i)
+            return bounds
+        #Only the landmarks on the goal's island tell anything. The bounds of
+        #squares on other islands are nonsense, but a search never gets there
+        distances = self.distances[self.distances[:, goal_i] < unknown_score]
+        if not len(distances):
+            bounds = [0] * self.distances.shape[1]
+        else:
+            gaps = distances - distances[:, goal_i:goal_i + 1]
+            np.abs(gaps, out=gaps)
+            bounds = gaps.max(axis=0).tolist()
+        self.goal_bounds[goal_i] = bounds
+        if len(self.goal_bounds) > alt_goals_kept:
+            self.goal_bounds.popitem(last=False)
+        return bounds
+
+
+def alt_star(start, goal, game_map,
+             cannot_enter=['edge', 'water']):
+    """a_star with the lower bounds of the map's LandmarkTable (A*,
+    Landmarks, Triangle inequality), so searches around lakes and along
+    coasts expand far fewer squares. Without a table, see
+    MapOverlay.landmark_table, it is plain a_star."""
+    table = game_map.landmark_table(cannot_enter)
+    bounds = table.bounds(goal) if table is not None else None
+    return a_star(start, goal, game_map, cannot_enter, bounds)
+
+
+pathfinders = {'a_star': a_star,
+               'bidirectional': bidirectional_a_star,
+               'auto': auto_path,
+               'alt': alt_star,
+               'jps': jps,
+               'hpa': hpa_star}
+
+
+def find_path(start, goal, game_map, cannot_enter=['edge', 'water'], method='a_star'):
+    """Find a path from start to goal with the pathfinder named by method
+
+    method is a key of pathfinders. All of them take the same arguments
+    and return the list of coordinates from start to goal, or False."""
+    return pathfinders[method](start, goal, game_map, cannot_enter)
+
+
+def pack_map(game_map):
+    """Return the arguments for a GridMap copy of game_map, to send to other processes"""
+    return (game_map.name, game_map.dims, game_map.interior, game_map.edge,
+            np.array(game_map.code_array()), list(game_map.terrain_names))
+
+
+_worker_map = None  #the map of the batch a find_paths worker process is serving
+_pool = None  #the find_paths process pool, kept for the next batch on the same map
+_pool_key = None  #the map's cache_key() and max_workers _pool was started with
+
+
+def _start_worker(packed_map):
+    """Set up a find_paths worker with the batch's map"""
+    global _worker_map
+    from GridMap import GridMap  #GridMap imports this module through BaseObjects
+    name, dims, interior, edge, codes, terrain_names = packed_map
+    _worker_map = GridMap(name, dims, interior, edge, codes=codes, terrain_names=terrain_names)
+
+
+def _find_path_chunk(chunk):
+    """Find the paths for a chunk of find_paths requests in a worker
+
+    Returns the paths and, if the batch is being recorded, the worker's
+    records of the searches to add to stats, else None"""
+    requests, method, record = chunk
+    if record:
+        enable_stats()
+    paths = [find_path(start, goal, _worker_map, cannot_enter, method)
+             for start, goal, cannot_enter in requests]
+    return paths, disable_stats().queries if record else None
+
+
+def worker_pool(game_map, max_workers):
+    """Return the find_paths process pool for game_map, starting a new one
+    if the map, or its terrain, differs from the last batch's"""
+    global _pool, _pool_key
+    key = (game_map.cache_key(), max_workers)
+    if _pool is None or _pool_key != key:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers, initializer=_start_worker,
+                                    initargs=(pack_map(game_map),))
+        _pool_key = key
+    return _pool
+
+
+def shutdown_pool():
+    """Stop the find_paths worker processes, if they are running"""
+    global _pool, _pool_key
+    if _pool is not None:
+        _pool.shutdown()
+    _pool = _pool_key = None
+
+atexit.register(shutdown_pool)
+
+
+def find_paths(requests, game_map, method='a_star', max_workers=None):
+    """Find the paths for a batch of (start, goal, cannot_enter) requests
+
+    Returns the find_path results in the order of requests. Batches of
+    parallel_batch_size requests or more are split into contiguous chunks
+    for a pool of max_workers processes (default one per CPU); the map is
+    sent once per worker as a GridMap of its terrain codes, so the workers
+    see the squares a MapOverlay changes but nothing else is shared with
+    them. The pool is kept for later batches on the same map, with the same
+    cache_key(), until shutdown_pool(). Smaller batches, or max_workers=1,
+    run here since starting the pool would cost more than the searches.
+    While stats is recording, the workers record their searches too and
+    send them back with the paths."""
+    requests = list(requests)
+    max_workers = max_workers or os.cpu_count() or 1
+    if len(requests) < parallel_batch_size or max_workers == 1:
+        return [find_path(start, goal, game_map, cannot_enter, method)
+                for start, goal, cannot_enter in requests]
+    chunk_size = -(-len(requests) // (max_workers * 4))
+    record = stats is not None
+    chunks = [(requests[i:i + chunk_size], method, record) for i in range(0, len(requests), chunk_size)]
+    pool = worker_pool(game_map, max_workers)
+    results = []
+    for paths, queries in pool.map(_find_path_chunk, chunks):
+        results.extend(paths)
+        for query in queries or ():
+            stats.record(query)
+    return results
+
+
+@recorded('distance_field', returns_path=False)
+def distance_field(goal, game_map, cannot_enter=['edge', 'water'], blocked=()):
+    """Breadth first search out from goal over the squares a unit that
+    cannot enter the given terrain can enter, skipping the squares in blocked
+
+    Returns a per square array (see search_array) holding the number of
+    steps from each square to goal, unknown_score for squares with no
+    route. A square's next step towards goal is then its neighbor with
+    the lowest distance, see FlowFields.next_step."""
+    height = game_map.dims[1] + 1
+    size = (game_map.dims[0] + 1) * height
+    passable = game_map.passability(cannot_enter)
+    neighbors = game_map.flat_neighbors
+    goal_i = goal[0] * height + goal[1]
+    blocked = set(x * height + y for x, y in blocked)
+    distance = search_array(size, unknown_score)
+    if not passable[goal_i] or goal_i in blocked:
+        return distance
+    distance[goal_i] = 0
+    frontier = [goal_i]
+    steps = 0
+    recording = _query is not None
+    reached = widest = 1
+    while frontier:
+        steps += 1
+        next_frontier = []
+        for i in frontier:
+            for n in neighbors(i):
+                if distance[n] != unknown_score or not passable[n] or n in blocked:
+                    continue
+                distance[n] = steps
+                next_frontier.append(n)
+        frontier = next_frontier
+        if recording:
+            reached += len(frontier)
+            widest = max(widest, len(frontier))
+    if recording:
+        _query.expanded, _query.peak_open = reached, widest
+    return distance
+
+
+@recorded('wavefront', returns_path=False)
+def wavefront(sources, passable, max_steps=None):
+    """Breadth first search out from all the sources at once, as whole
+    array operations on a passability array
+
+    passable is a boolean array of the squares that can be entered, like
+    Map.passable_array, and sources a list of coordinates. Each step grows
+    the frontier with shifted slices of the box around it and looks up the
+    parents of just the new squares, so a search costs a few numpy
+    operations per step instead of a Python loop per square. The search
+    stops after max_steps steps if given. It pays off for many sources or
+    few steps, like the landmark distances of LandmarkTable; for one goal
+    on a small map distance_field's queue is quicker.
+
+    Returns the distance and parent arrays, the shape of passable:
+    distance[x, y] is the number of steps from (x, y) to the nearest
+    source, unknown_score where the search did not reach, and parent[x, y]
+    the code in direction_steps of the step from (x, y) towards that
+    source, no_direction at the sources and the squares not reached (see
+    wavefront_path)."""
+    w, h = passable.shape
+    distance = np.full(passable.shape, unknown_score, dtype=np.int32)
+    parent = np.full(passable.shape, no_direction, dtype=np.uint8)
+    unreached = passable.copy()
+    sources = [xy for xy in sources if passable[xy]]
+    if not sources:
+        return distance, parent
+    xs, ys = (np.array(a) for a in zip(*sources))
+    distance[xs, ys] = 0
+    unreached[xs, ys] = False
+    #xs, ys hold the frontier, relative to x0, y0, the corner of the box it was found in
+    x0, y0 = 0, 0
+    steps = 0
+    while len(xs) and (max_steps is None or steps < max_steps):
+        steps += 1
+        bx0, bx1 = max(x0 + xs.min() - 1, 0), min(x0 + xs.max() + 2, w)
+        by0, by1 = max(y0 + ys.min() - 1, 0), min(y0 + ys.max() + 2, h)
+        old = np.zeros((bx1 - bx0, by1 - by0), dtype=np.bool_)
+        old[xs + x0 - bx0, ys + y0 - by0] = True
+        box = (slice(bx0, bx1), slice(by0, by1))
+        #grow the frontier one square in x then in y, which covers the diagonals too
+        grown = old.copy()
+        grown[1:, :] |= old[:-1, :]
+        grown[:-1, :] |= old[1:, :]
+        around = grown.copy()
+        around[:, 1:] |= grown[:, :-1]
+        around[:, :-1] |= grown[:, 1:]
+        open_squares = unreached[box]
+        around &= open_squares
+        open_squares &= ~around
+        xs, ys = np.nonzero(around)
+        #each new square's parent is its first neighbor in the old frontier
+        codes = np.full(len(xs), no_direction, dtype=np.uint8)
+        for code, (dx, dy) in enumerate(direction_steps):
+            px, py = xs + dx, ys + dy
+            found = ((codes == no_direction) & (px >= 0) & (px < old.shape[0]) &
+                     (py >= 0) & (py < old.shape[1]))
+            found[found] = old[px[found], py[found]]
+            codes[found] = code
+        parent[xs + bx0, ys + by0] = codes
+        distance[xs + bx0, ys + by0] = steps
+        x0, y0 = bx0, by0
+    if _query is not None:
+        _query.expanded = int((distance < unknown_score).sum())
+    return distance, parent
+
+
+def wavefront_path(parent, xy):
+    """Return the squares from xy to its nearest source, following the parent
+    array of a wavefront; just [xy] at a source or a square not reached"""
+    path = [xy]
+    code = parent[xy]
+    while code != no_direction:
+        step = direction_steps[code]
+        xy = (xy[0] + step[0], xy[1] + step[1])
+        path.append(xy)
+        code = parent[xy]
+    return path
+
+
+@recorded('nearest_targets', returns_path=False)
+def nearest_targets(start, targets, game_map, cannot_enter=['edge', 'water'], k=5, blocked=()):
+    """Breadth first search out from start for the k nearest of the given
+    target coordinates
+
+    Returns a list of (target, distance, first step) tuples, nearest first,
+    for up to k targets: distance is the length of the shortest route and
+    first step the square to move to from start on it. Targets the unit
+    cannot reach, or at start, are left out. The search stops as soon as
+    k targets are found, so picking from many targets costs one bounded
+    search instead of one a_star per target. The squares in blocked are
+    not entered."""
+    height = game_map.dims[1] + 1
+    size = (game_map.dims[0] + 1) * height
+    passable = game_map.passability(cannot_enter)
+    neighbors = game_map.flat_neighbors
+    start_i = start[0] * height + start[1]
+    wanted = {}
+    for x, y in targets:
+        wanted.setdefault(x * height + y, []).append((x, y))
+    wanted.pop(start_i, None)
+    blocked = set(x * height + y for x, y in blocked)
+    #first_step[i] is the flat index of the first square on the route to i
+    first_step = search_array(size, -1)
+    first_step[start_i] = start_i
+    found = []
+    frontier = [start_i]
+    steps = 0
+    recording = _query is not None
+    reached = widest = 1
+    while frontier and wanted and len(found) < k:
+        steps += 1
+        next_frontier = []
+        for i in frontier:
+            for n in neighbors(i):
+                if first_step[n] >= 0 or not passable[n] or n in blocked:
+                    continue
+                first_step[n] = n if i == start_i else first_step[i]
+                next_frontier.append(n)
+                if n in wanted:
+                    step = divmod(first_step[n], height)
+                    found.extend((target, steps, step) for target in wanted.pop(n))
+        frontier = next_frontier
+        if recording:
+            reached += len(frontier)
+            widest = max(widest, len(frontier))
+    if recording:
+        _query.expanded, _query.peak_open = reached, widest
+    return found[:k]
+
+
+class FlowFields(object):
+    """FlowFields - distance fields towards targets, shared by every unit
+    heading for the same target
+
+    A field is one distance_field search per target and cannot_enter, after
+    which any unit reads its next step from its neighbors, so N units
+    chasing one city cost one search instead of N. Fields are kept until
+    new_turn() is called or the map changes (see Map.version), and a field
+    asked for with a different blocked set than it was made with is redone.
+    Squares to keep off without redoing the field, like friendly units that
+    will move anyway, go in next_step's avoid instead."""
+
+    def __init__(self, game_map):
+        self.map = game_map
+        self.fields = {}  #(target, cannot_enter): (blocked, field)
+        self.version = game_map.version
+
+    def new_turn(self):
+        """Drop the fields, the targets may have moved"""
+        self.fields = {}
+
+    def field(self, target, cannot_enter, blocked=()):
+        """Return the distance field towards target, see distance_field"""
+        if self.map.version != self.version:
+            self.fields = {}
+            self.version = self.map.version
+        key = (target, frozenset(cannot_enter))
+        blocked = frozenset(blocked)
+        kept = self.fields.get(key)
+        if kept is None or kept[0] != blocked:
+            kept = self.fields[key] = (blocked, distance_field(target, self.map, cannot_enter, blocked))
+        return kept[1]
+
+    def next_step(self, xy, target, cannot_enter, blocked=(), avoid=()):
+        """Return the square to move to from xy towards target, or None if
+        no neighbor outside avoid is closer to target"""
+        height = self.map.dims[1] + 1
+        distance = self.field(target, cannot_enter, blocked)
+        current = xy[0] * height + xy[1]
+        best, best_distance = None, distance[current]
+        for n in self.map.flat_neighbors(current):
+            if distance[n] < best_distance:
+                step = divmod(n, height)
+                if step not in avoid:
+                    best, best_distance = step, distance[n]
+        return best
+
+
+class PathCache(object):
+    """PathCache - a bounded least recently used cache in front of find_path
+
+    Paths are kept by start, goal, cannot_enter, method and the map's
+    cache_key(), which changes with every terrain change and, for a
+    MapOverlay, with its changed squares, so a stale path is never
+    returned. A query from a square on a cached path to the same goal, e.g.
+    after the unit took a few steps along it, is answered with the rest of
+    that path. hits (suffix_hits of them from the rest of a path), misses
+    and evictions are counted to size max_size."""
+
+    def __init__(self, max_size=default_path_cache_size):
+        self.max_size = max_size
+        self.paths = OrderedDict()  #key: path or False, least recently used first
+        self.by_goal = {}  #key without the start: set of the keys with that goal
+        self.hits = 0
+        self.suffix_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def find_path(self, start, goal, game_map, cannot_enter=['edge', 'water'], method='a_star'):
+        """Return find_path(start, goal, game_map, cannot_enter, method), from the cache if possible"""
+        goal_key = (goal, frozenset(cannot_enter), method, game_map.cache_key())
+        key = (start,) + goal_key
+        if key in self.paths:
+            self.paths.move_to_end(key)
+            self.hits += 1
+            self.record_lookup(True)
+            path = self.paths[key]
+            return list(path) if path else path
+        for other in self.by_goal.get(goal_key, ()):
+            path = self.paths[other]
+            if path and start in path:
+                self.paths.move_to_end(other)
+                self.hits += 1
+                self.suffix_hits += 1
+                self.record_lookup(True)
+                return path[path.index(start):]
+        self.misses += 1
+        self.record_lookup(False)
+        path = find_path(start, goal, game_map, cannot_enter, method)
+        self.paths[key] = path
+        self.by_goal.setdefault(goal_key, set()).add(key)
+        while len(self.paths) > self.max_size:
+            old_key, _ = self.paths.popitem(last=False)
+            keys = self.by_goal[old_key[1:]]
+            keys.discard(old_key)
+            if not keys:
+                del self.by_goal[old_key[1:]]
+            self.evictions += 1
+        return list(path) if path else path
+
+    def record_lookup(self, hit):
+        """Record a lookup in stats, if recording"""
+        if stats is not None:
+            stats.record({'kind': 'cache', 'hit': hit})
+
+    def clear(self):
+        """Drop every path, the counters are kept"""
+        self.paths.clear()
+        self.by_goal = {}
+
+
+class DStarLite(object):
+    """DStarLite - an incremental planner for one unit heading for one goal
+
+    The search runs backwards from goal, so the distances it has found stay
+    valid as the unit moves. Each next_step() call takes the unit's square
+    and the squares blocked now, e.g. by friendly units, and finds the
+    squares that opened or closed since the last call, from the blocked
+    set and, if the map's version changed, a compare of its passability
+    layer. Only the searches around those squares are repaired, the rest of
+    the plan is kept, so a unit whose way is blocked for a step costs a
+    handful of expansions instead of a new search. A repair can be limited,
+    as in budgeted_a_star; one cut short goes on at the next call.
+
+    Squares are flat indices as in a_star, each step costs 1 and a square
+    can be entered if it is passable and not blocked. expansions counts
+    the squares expanded over the planner's life.
+
+    from Koenig and Likhachev, D* Lite, AAAI 2002"""
+
+    def __init__(self, start, goal, game_map, cannot_enter=['edge', 'water'], blocked=()):
+        self.map = game_map
+        self.goal = goal
+        self.cannot_enter = frozenset(cannot_enter)
+        self.height = game_map.dims[1] + 1
+        self.neighbors = game_map.flat_neighbors
+        self.layer = bytes(game_map.passability(cannot_enter))
+        self.version = game_map.version
+        self.blocked = self.flat_set(blocked)
+        self.start_i = start[0] * self.height + start[1]
+        self.goal_i = goal[0] * self.height + goal[1]
+        self.g_score = {}
+        self.rhs = {self.goal_i: 0}  #one step lookahead of g_score
+        self.key_modifier = 0  #sum of the distances the start moved, keeps old keys valid
+        self.open_heap = []
+        self.queued = {}  #square: its current key, entries with any other key are stale
+        self.expansions = 0
+        self.push = heappush  #or the recorded search's push, see next_step
+        self.queue(self.goal_i)
+
+    def flat_set(self, squares):
+        """Return the set of flat indices of the given coordinates"""
+        return set(x * self.height + y for x, y in squares)
+
+    def distance(self, a, b):
+        """Chebyshev distance between two flat indices"""
+        ax, ay = divmod(a, self.height)
+        bx, by = divmod(b, self.height)
+        return max(abs(ax - bx), abs(ay - by))
+
+    def enter_cost(self, i):
+        return 1 if self.layer[i] and i not in self.blocked else unknown_score
+
+    def key(self, i):
+        best = min(self.g_score.get(i, unknown_score), self.rhs.get(i, unknown_score))
+        return best + self.distance(self.start_i, i) + self.key_modifier, best
+
+    def queue(self, i):
+        key = self.queued[i] = self.key(i)
+        self.push(self.open_heap, (key, i))
+
+    def update_square(self, i):
+        """Recompute the lookahead of square i and queue it if inconsistent"""
+        if i != self.goal_i:
+            best = unknown_score
+            for n in self.neighbors(i):
+                if self.enter_cost(n) == 1:
+                    best = min(best, 1 + self.g_score.get(n, unknown_score))
+            self.rhs[i] = best
+        self.queued.pop(i, None)
+        if self.g_score.get(i, unknown_score) != self.rhs.get(i, unknown_score):
+            self.queue(i)
+
+    def top_key(self):
+        """Return the smallest current key in the queue, dropping stale entries"""
+        while self.open_heap:
+            key, i = self.open_heap[0]
+            if self.queued.get(i) == key:
+                return key
+            heappop(self.open_heap)
+        return unknown_score, unknown_score
+
+    def compute_plan(self, max_nodes=None, deadline=None):
+        """Expand squares until the start's distance is known and consistent
+
+        Returns True once it is, or False if it stopped first, after taking
+        max_nodes squares off the queue or at deadline, a time.monotonic()
+        time; the queue is kept, so the next call goes on from there."""
+        start = self.start_i
+        expanded = 0
+        while (self.top_key() < self.key(start) or
+               self.rhs.get(start, unknown_score) != self.g_score.get(start, unknown_score)):
+            if not self.open_heap:
+                break
+            if max_nodes is not None and expanded >= max_nodes:
+                return False
+            if (deadline is not None and expanded and not expanded % deadline_check_interval
+                    and time.monotonic() >= deadline):
+                return False
+            expanded += 1
+            old_key, current = heappop(self.open_heap)
+            del self.queued[current]
+            new_key = self.key(current)
+            if old_key < new_key:
+                self.queue(current)
+                continue
+            self.expansions += 1
+            rhs = self.rhs.get(current, unknown_score)
+            if self.g_score.get(current, unknown_score) > rhs:
+                self.g_score[current] = rhs
+                for n in self.neighbors(current):
+                    self.update_square(n)
+            else:
+                self.g_score[current] = unknown_score
+                self.update_square(current)
+                for n in self.neighbors(current):
+                    self.update_square(n)
+        return True
+
+    @recorded('dstar', returns_path=False)
+    def next_step(self, start, blocked=(), max_nodes=None, deadline=None):
+        """Return the square to move to from start, or None if the goal
+        cannot be reached
+
+        blocked holds the squares that cannot be entered now, besides the
+        terrain. max_nodes and deadline limit the repair, see compute_plan;
+        None is also returned if it was cut short. When recorded, a call
+        counts the expansions of its repair and the largest the queue grew
+        to."""
+        self.push = _recording()
+        if _query is not None:
+            _query.peak_open = len(self.open_heap)
+        expansions = self.expansions
+        start_i = start[0] * self.height + start[1]
+        if start_i != self.start_i:
+            self.key_modifier += self.distance(self.start_i, start_i)
+            self.start_i = start_i
+        blocked = self.flat_set(blocked)
+        changed = self.blocked ^ blocked
+        self.blocked = blocked
+        if self.map.version != self.version:
+            layer = bytes(self.map.passability(self.cannot_enter))
+            changed.update(np.flatnonzero(np.frombuffer(layer, dtype=np.uint8) !=
+                                          np.frombuffer(self.layer, dtype=np.uint8)).tolist())
+            self.layer = layer
+            self.version = self.map.version
+        for square in changed:
+            #Only the moves into the square changed cost
+            for n in self.neighbors(square):
+                self.update_square(n)
+        finished = self.compute_plan(max_nodes, deadline)
+        if _query is not None:
+            _query.expanded = self.expansions - expansions
+        if not finished or self.g_score.get(start_i, unknown_score) >= unknown_score:
+            return None
+        best, best_score = None, unknown_score
+        for n in self.neighbors(start_i):
+            if self.enter_cost(n) == 1 and self.g_score.get(n, unknown_score) < best_score:
+                best, best_score = n, self.g_score[n]
+        return divmod(best, self.height) if best is not None else None
+
+    def path(self):
+        """Return the planned squares from the start to the goal, or False"""
+        if self.g_score.get(self.start_i, unknown_score) >= unknown_score:
+            return False
+        current = self.start_i
+        total_path = [divmod(current, self.height)]
+        while current != self.goal_i:
+            current = min((n for n in self.neighbors(current) if self.enter_cost(n) == 1),
+                          key=lambda n: self.g_score.get(n, unknown_score))
+            total_path.append(divmod(current, self.height))
+        return total_path
+
+
+class ReservationTable(object):
+    """ReservationTable - which unit holds each square at each time step
+
+    Keys are (flat index, time step), values the holder. A unit holds the
+    square it is on at each step and, so that no unit follows another into
+    a square in the same step or swaps squares with it, the square it is
+    on for the step after too. Since no unit enters a square a unit is
+    leaving, the moves of a step can be made one by one in any order."""
+
+    def __init__(self):
+        self.reserved = {}
+
+    def is_free(self, i, t, unit):
+        """Return True if square i at time step t is free for the given unit"""
+        return self.reserved.get((i, t), unit) == unit
+
+    def is_free_after(self, i, t, unit, window):
+        """Return True if square i is free for the unit from time step t to the end of the window"""
+        return all(self.is_free(i, step, unit) for step in range(t, window + 1))
+
+    def reserve(self, path, window, unit):
+        """Reserve a path of flat indices, one per time step from 0, for the
+        unit; it stays on the last square to the end of the window"""
+        for t, i in enumerate(path):
+            self.reserved[(i, t)] = unit
+            self.reserved[(i, t + 1)] = unit
+        for t in range(len(path), window + 1):
+            self.reserved[(path[-1], t)] = unit
+
+
+@recorded('space_time_a_star')
+def space_time_a_star(start_i, goal_i, game_map, cannot_enter, distance, table, unit, window):
+    """A* over (square, time step) for one unit of a cooperative plan
+
+    Each step moves to a neighbor or waits, and costs 1. The heuristic is
+    the true distance to goal from a distance_field, so the search only
+    has to look window steps ahead: it ends at the goal, if the unit can
+    stay there to the end of the window, or at the first node window steps
+    out, which has the lowest time plus distance left.
+    Squares reserved in table for other units are not entered.
+
+    Returns the flat indices of the unit's square at each time step"""
+    passable = game_map.passability(cannot_enter)
+    neighbors = game_map.flat_neighbors
+    came_from = {(start_i, 0): None}
+    closed = set()
+    push = _recording(closed)
+    #The start may be a square the unit could not enter, and so have no distance
+    start_h = min([distance[n] + 1 for n in neighbors(start_i)] + [distance[start_i]])
+    open_heap = [(start_h, start_h, 0, start_i)]
+    best = (start_h, 0, start_i)  #the node closest to the goal, for when every route is held
+    end = None
+    while open_heap:
+        _, h, t, current = heappop(open_heap)
+        if (current, t) in closed:
+            continue
+        closed.add((current, t))
+        if t == window or (current == goal_i and table.is_free_after(current, t, unit, window)):
+            end = (current, t)
+            break
+        if (h, -t) < (best[0], -best[1]):
+            best = (h, t, current)
+        for n in neighbors(current) + (current,):
+            if n != current and (not passable[n] or distance[n] >= unknown_score):
+                continue
+            #The unit holds n for the step after it arrives as well
+            if (n, t + 1) in closed or (n, t + 1) in came_from or not table.is_free(n, t + 1, unit) or \
+                    not table.is_free(n, t + 2, unit):
+                continue
+            came_from[(n, t + 1)] = (current, t)
+            h = distance[n] if distance[n] < unknown_score else start_h
+            push(open_heap, (t + 1 + h, h, t + 1, n))
+    if end is None:
+        end = (best[2], best[1])
+    path = []
+    while end is not None:
+        path.append(end[0])
+        end = came_from[end]
+    path.reverse()
+    return path
+
+
+def cooperative_paths(requests, game_map, flow_fields, window=default_plan_window, reserved=()):
+    """Plan the moves of a group of units together, so they do not block
+    each other (Windowed Hierarchical Cooperative A*)
+
+    requests is a list of (start, goal, cannot_enter) for each unit, goal
+    None for units that stay put, in order of priority. Each unit is
+    planned with space_time_a_star in turn, around the squares the units
+    before it reserved, looking window steps ahead; the true distance past
+    the window comes from flow_fields (a FlowFields). reserved holds the
+    squares of other units that stay put.
+
+    Returns the list of squares each unit is on at each time step from 0,
+    starting with its start; the list ends early if the goal is reached.
+    The step from time 0 to 1 of every unit can be made one unit at a
+    time, in any order, without collisions (see ReservationTable). A unit
+    boxed in by the plans before it keeps its square, and its later steps
+    may then clash with theirs; plans are meant to be redone every turn.
+
+    from Silver, Cooperative Pathfinding, AIIDE 2005"""
+    height = game_map.dims[1] + 1
+    table = ReservationTable()
+    for x, y in reserved:
+        table.reserve([x * height + y], window, ('reserved', x, y))
+    starts = [start[0] * height + start[1] for start, goal, cannot_enter in requests]
+    for unit, start_i in enumerate(starts):
+        #Every unit holds its start until it has moved, the ones staying put for good
+        table.reserve([start_i], window if requests[unit][1] is None else 0, unit)
+    paths = []
+    for unit, (start, goal, cannot_enter) in enumerate(requests):
+        if goal is None:
+            path = [starts[unit]]
+        else:
+            distance = flow_fields.field(goal, cannot_enter)
+            path = space_time_a_star(starts[unit], goal[0] * height + goal[1], game_map,
+                                     cannot_enter, distance, table, unit, window)
+        table.reserve(path, window, unit)
+        paths.append([divmod(i, height) for i in path])
+    return paths
+
+
+class GotoOrder(object):
+    """GotoOrder - a standing order for a unit to move to a target
+
+    target is anything with coords, like a City or a unit, or coordinates.
+    The route is found once, with find_path, and kept as one byte per step,
+    the code of the step in direction_steps; at is how many steps of it the
+    unit has taken. Each next_step() only checks the next square of the
+    route. The route is found again only when that square cannot be
+    entered or is blocked, when the target has moved from the end of the
+    route, or when the unit has left the route (it was moved some other
+    way). replans counts the routes found after the first.
+
+    method is the find_path method. cache is an optional PathCache to find
+    the routes through, e.g. the game's, so orders to the same target share
+    their routes."""
+
+    def __init__(self, target, cannot_enter=['edge', 'water'], method='alt', cache=None):
+        self.target = target
+        self.cannot_enter = cannot_enter
+        self.method = method
+        self.cache = cache
+        self.goal = None  #the target's square when the route was found
+        self.position = None  #where the route expects the unit to be
+        self.route = b''
+        self.at = 0
+        self.replans = -1
+
+    def target_coords(self):
+        """Return the square the target is on"""
+        return getattr(self.target, 'coords', self.target)
+
+    def peek(self):
+        """Return the next square of the route, or None at its end"""
+        if self.at >= len(self.route):
+            return None
+        step = direction_steps[self.route[self.at]]
+        return self.position[0] + step[0], self.position[1] + step[1]
+
+    def plan(self, xy, game_map, blocked=()):
+        """Find the route from xy to the target, around the blocked squares"""
+        from BaseObjects import MapOverlay  #BaseObjects imports this module
+        self.goal = self.target_coords()
+        blocked = set(blocked) - {self.goal}
+        if blocked:
+            game_map = MapOverlay(game_map, blocked=blocked)
+        finder = find_path if self.cache is None else self.cache.find_path
+        path = finder(xy, self.goal, game_map, self.cannot_enter, self.method) or [xy]
+        self.route = bytes(direction_codes[(b[0] - a[0], b[1] - a[1])] for a, b in zip(path, path[1:]))
+        self.position = xy
+        self.at = 0
+        self.replans += 1
+
+    def next_step(self, xy, game_map, blocked=()):
+        """Return the square to move to from xy, or None if the unit is at
+        the target or cannot reach it
+
+        A unit that has moved to the route's next square since the last
+        call has taken that step."""
+        if xy != self.position and xy == self.peek():
+            self.position = xy
+            self.at += 1
+        if xy == self.target_coords():
+            return None
+        step = self.peek()
+        if (self.goal != self.target_coords() or xy != self.position or step is None or
+                step in blocked or not game_map.can_enter(step, self.cannot_enter)):
+            self.plan(xy, game_map, blocked)
+            step = self.peek()
+        return step
+
+    def steps_left(self):
+        """Return the number of steps left on the route"""
+        return len(self.route) - self.at
@@ -30,6 +30,7 @@ class Player(object):
         self.color = color
 
         self.AI = None
+        self.occupancy = None  #the Game's Occupancy, set by the Game
 
     def assign_city(self, city, build_unit=True):
         """assign a city to the player"""
@@ -37,7 +38,7 @@ class Player(object):
             city.owner.cities.remove(city)
             for u in city.owner.units.copy():
                 if u.coords == city.coords:
-                    u.owner.units.remove(u)
+                    u.owner.remove_unit(u)
                     u.plane.destroy()
                     u.plane = None
 
@@ -52,6 +53,14 @@ class Player(object):
         """assign a unit to the player"""
         self.units.append(unit)
         unit.owner = self
+        if self.occupancy is not None:
+            self.occupancy.add(unit)
+
+    def remove_unit(self, unit):
+        """remove a unit that was destroyed or captured from the player"""
+        self.units.remove(unit)
+        if self.occupancy is not None:
+            self.occupancy.remove(unit)
 
     def turn_step(self, G):
         """Adjust the player to reflect moving forward in time.
@@ -19,12 +19,13 @@
 #     Work on this file started on 25 January, 2020
 
 import pygame.time
-from pygame.locals import K_KP1, K_KP2, K_KP3, K_KP4, K_KP6, K_KP7, K_KP8, K_KP9
 import random
-from copy import copy
-from BaseObjects import Unit, a_star, Map
+import time
+from BaseObjects import MapOverlay
+from Pathfinding import GotoOrder, DStarLite, budgeted_a_star, nearest_targets, cooperative_paths, \
+    default_plan_window
 from Cities import City
-from GroundUnits import Infantry
+from GroundUnits import Infantry, direction_keys
 
 try:
     _choices = random.choices
@@ -42,10 +43,25 @@ class AI():
 
         self.moving_unit = None
         self.moving_unit_selected = True
+        self.move_delay = 450  #milliseconds to wait before each move, so it can be followed
 
         self.base_scores = {City: 100,
                             Infantry: 100}
         self.assigned_targets = {}
+        self.num_targets = 5  #how many of the nearest targets find_targets ranks
+        self.first_steps = {}  #target: first step towards it, from find_targets
+        self.first_steps_from = None  #the unit and square first_steps were found from
+        #Incremental planners for units whose way is held by friendly units
+        self.planners = {}
+        #Limits on the searches of a detour, see detour
+        self.search_nodes = 2000
+        self.search_time = 0.05  #seconds
+        #This turn's moves for all my units, planned together, see plan_turn
+        self.plan = {}
+        self.planned_turn = None
+        self.fallback_from = {}  #unit: the square of its last move_unit move this turn
+        self.waiting = set()  #units with a target that the turn's plan leaves waiting
+        self.plan_window = default_plan_window
 
     def next_move(self):
         """Determine my next move
@@ -54,97 +70,222 @@ class AI():
         'End_Turn': end my turn
         'select', Unit: select the given unit
         'move', Unit, key: move the given unit in the direction indicated by key
+        A unit that cannot move ends its move and the next unit is tried.
         """
-        pygame.time.wait(450)
-        self.moving_unit = self.player.next_to_move()
-        if self.moving_unit and not self.moving_unit_selected:
-            self.moving_unit_selected = True
-            #print("{} selected".format(self.moving_unit.name))
-            return ['select', self.moving_unit]
-        elif self.moving_unit:
-            t = self.select_target(self.moving_unit)
-            dir, key = self.move_unit(t)
-            if dir and key:
-                # print("{} target is {}, moving {}".format(self.moving_unit.name,
-                #                                          t.name,
-                #                                           dir))
-                return ['move', self.moving_unit, key]
+        pygame.time.wait(self.move_delay)
+        while True:
+            self.moving_unit = self.player.next_to_move()
+            if self.moving_unit and not self.moving_unit_selected:
+                self.moving_unit_selected = True
+                #print("{} selected".format(self.moving_unit.name))
+                return ['select', self.moving_unit]
+            elif self.moving_unit:
+                dir, key = self.choose_move(self.moving_unit)
+                if dir and key:
+                    # print("{} target is {}, moving {}".format(self.moving_unit.name,
+                    #                                          t.name,
+                    #                                           dir))
+                    return ['move', self.moving_unit, key]
+                else:
+                    self.moving_unit.moved = self.moving_unit.move_speed
+                    self.moving_unit.selected = False
+                    self.moving_unit = None
             else:
-                self.moving_unit.moved = self.moving_unit.move_speed
-                self.moving_unit.selected = False
-                self.moving_unit = None
+                self.moving_unit_selected = False
+                self.planners = {u: p for u, p in self.planners.items() if u in self.player.units}
+                return ["End Turn"]
+
+    def choose_move(self, unit):
+        """Return the direction and key of the unit's next move, or False, False
+
+        A unit takes its move of the turn's plan. Units the plan leaves
+        waiting, whose planned move did not happen or that are not in the
+        plan move with move_unit, once from each square, so a move that
+        fails is not tried again; the units the plan leaves waiting, boxed
+        in by the others, detour around them. A unit keeps heading for the
+        target of its goto order while that is an enemy, so its D* Lite
+        planner, made for that target, is kept across steps and turns."""
+        if self.planned_turn != self.game.turn:
+            self.plan_turn()
+        if unit in self.plan:
+            dir, key = self.planned_move(unit)
+            if key:
+                return dir, key
+        if self.fallback_from.get(unit) == unit.coords:
+            return False, False
+        self.fallback_from[unit] = unit.coords
+        if unit.goto is not None and self.is_enemy(unit.goto.target):
+            t = unit.goto.target
         else:
-            self.moving_unit_selected = False
-            return ["End Turn"]
+            t = self.select_target(unit)
+        if not t:
+            return False, False
+        if unit in self.waiting:
+            return self.detour(unit, t)
+        return self.move_unit(t)
 
     def move_unit(self, target):
-        """Move the moving_unit towards the target if it can"""
-        dir = self.moving_unit.direction_to(target)
-        print("{}'s {} at {} moving to {} path:".format(self.player.name,
-                                                        self.moving_unit.name,
-                                                        self.moving_unit.coords,
-                                                        target.coords))
-        adj_map = copy(self.game.map)
-        for u in self.player.units:
-            adj_map[u.coords] = 'edge' #mark friendly units as impassible
-        path_to_target = a_star(self.moving_unit.coords, target.coords, adj_map,
-                                self.moving_unit.cannot_enter)
-        if path_to_target:
-            new_coords = path_to_target[1]
-        else:
+        """Move the moving_unit towards the target if it can
+
+        The unit takes the first step find_targets found, or steps down the
+        shared distance field, keeping off friendly units. When friendly
+        units hold every closer square the unit detours around them, see
+        detour. The searches can be recorded with Pathfinding.enable_stats"""
+        unit = self.moving_unit
+        friendly = set(u.coords for u in self.player.units) - {unit.coords}
+        new_coords = None
+        if self.first_steps_from == (unit, unit.coords):
+            new_coords = self.first_steps.get(target)
+        if new_coords is None or new_coords in friendly:
+            new_coords = self.game.flow_fields.next_step(unit.coords, target.coords,
+                                                         unit.cannot_enter, avoid=friendly)
+        if new_coords is None:
+            #the way is held by friendly units, plan around them
+            return self.detour(unit, target)
+        dir = (new_coords[0] - unit.coords[0],
+               new_coords[1] - unit.coords[1])
+        key = direction_keys[dir]
+        return dir, key
+
+    def detour(self, unit, target):
+        """Return the direction and key of the unit's step around the friendly
+        units towards the target, or False, False
+
+        The unit's D* Lite planner repairs its route; if it has no step, a
+        search finds the best part of a route. Each search expands at most
+        search_nodes squares and both end within search_time seconds, so
+        the unit moves within that time; a repair cut short goes on at the
+        unit's next detour."""
+        friendly = set(u.coords for u in self.player.units) - {unit.coords}
+        deadline = time.monotonic() + self.search_time
+        new_coords = self.planner(unit, target).next_step(unit.coords, friendly,
+                                                          self.search_nodes, deadline)
+        if new_coords is None:
+            new_coords = self.budgeted_step(unit, target, friendly, deadline)
+        if new_coords is None:
             return False, False
-        print("{}".format(path_to_target))
-        print("{}: {}".format(new_coords,
-                              self.game.map[new_coords]))
-        while True:
-            u = self.moving_unit.check_collision(new_coords, self.game)
-            if isinstance(u, City):
-                break
-            elif isinstance(u, Unit) and not (self.moving_unit.owner is u.owner):
-                break
-            elif self.game.map[new_coords] in self.moving_unit.cannot_enter or u:
-                new_dir = {( 0,  1): ( 1,  1),  #adjust movement clockwise
-                           ( 1,  1): ( 1,  0),
-                           ( 1,  0): ( 1, -1),
-                           ( 1, -1): ( 0, -1),
-                           ( 0, -1): (-1, -1),
-                           (-1, -1): (-1,  0),
-                           (-1,  0): (-1,  1),
-                           (-1,  1): ( 0,  1)}[dir]
-                new_coords = (self.moving_unit.coords[0] + new_dir[0],
-                              self.moving_unit.coords[1] + new_dir[1])
-                #print("move unit found collision {} {}".format(dir, new_dir))
-                dir = new_dir
+        dir = (new_coords[0] - unit.coords[0],
+               new_coords[1] - unit.coords[1])
+        return dir, direction_keys[dir]
+
+    def planner(self, unit, target):
+        """Return the unit's planner for the target, kept across steps and turns"""
+        planner = self.planners.get(unit)
+        if planner is None or planner.goal != target.coords or planner.map is not self.game.map:
+            planner = DStarLite(unit.coords, target.coords, self.game.map, unit.cannot_enter)
+            self.planners[unit] = planner
+        return planner
+
+    def budgeted_step(self, unit, target, friendly, deadline):
+        """Return the first step of the best route around the friendly units
+        found within search_nodes expansions and by deadline, or None"""
+        game_map = MapOverlay(self.game.map, blocked=friendly - {target.coords})
+        table = game_map.landmark_table(unit.cannot_enter)
+        status, path = budgeted_a_star(unit.coords, target.coords, game_map, unit.cannot_enter,
+                                       self.search_nodes, deadline,
+                                       table.bounds(target.coords) if table else None)
+        if not path or len(path) < 2:
+            return None
+        return path[1]
+
+    def plan_turn(self):
+        """Plan this turn's moves for all my units together
+
+        A unit keeps its goto order while the target is still an enemy, and
+        takes the next step of the order's route if no friendly unit is on
+        it or stepping into it. The rest, and units that need a new target,
+        are planned in turn around each other's moves and those steps (see
+        Pathfinding.cooperative_paths), so they do not block each other."""
+        movers = [u for u in self.player.units if u.moved < u.move_speed]
+        claimed = set(u.coords for u in self.player.units)  #no unit steps where a friendly unit is
+        self.plan = {}
+        self.fallback_from = {}
+        planned, requests = [], []
+        for unit in movers:
+            if unit.goto is None or not self.is_enemy(unit.goto.target):
+                target = self.select_target(unit)
+                unit.goto = None
+                if target:
+                    unit.goto = GotoOrder(target, unit.cannot_enter, cache=self.game.path_cache)
+            step = unit.goto.next_step(unit.coords, self.game.map) if unit.goto else None
+            if step is not None and step not in claimed:
+                claimed.add(step)
+                self.plan[unit] = [unit.coords, step]
             else:
-                break
-        key = {( 0,  1): K_KP2,
-               ( 1,  1): K_KP3,
-               ( 1,  0): K_KP6,
-               ( 1, -1): K_KP9,
-               ( 0, -1): K_KP8,
-               (-1, -1): K_KP7,
-               (-1,  0): K_KP4,
-               (-1,  1): K_KP1}[dir]
-        return dir, key
+                planned.append(unit)
+                goal = unit.goto.target_coords() if unit.goto else None
+                requests.append((unit.coords, goal, unit.cannot_enter))
+        reserved = claimed - set(u.coords for u in planned)
+        paths = cooperative_paths(requests, self.game.map, self.game.flow_fields,
+                                  self.plan_window, reserved)
+        self.plan.update(zip(planned, paths))
+        self.waiting = set(u for u in planned if u.goto and self.plan[u][1:2] in ([], [u.coords]))
+        self.planned_turn = self.game.turn
+
+    def is_enemy(self, target):
+        """Return True if target is a city or unit still held by another player"""
+        if isinstance(target, City):
+            return target.owner is not self.player
+        return target.owner not in (None, self.player) and target in target.owner.units
+
+    def planned_move(self, unit):
+        """Return the direction and key of the unit's planned move, or False, False
+        if it waits; a unit gets its planned move once"""
+        path = self.plan[unit]
+        self.plan[unit] = []
+        if len(path) < 2 or path[1] == unit.coords:
+            return False, False
+        dir = (path[1][0] - unit.coords[0], path[1][1] - unit.coords[1])
+        return dir, direction_keys[dir]
+
+    def planned_moves(self):
+        """Return the (unit, key) moves of this turn's plan that are still to
+        be made, e.g. for World.execute_moves; they can be made in any order"""
+        if self.planned_turn != self.game.turn:
+            self.plan_turn()
+        moves = []
+        for unit in list(self.plan):
+            dir, key = self.planned_move(unit)
+            if key:
+                moves.append((unit, key))
+        return moves
 
     def select_target(self, unit):
-        """Select a target randomly from the """
+        """Select a target randomly from the best scoring targets
+
+        Returns None if the unit cannot reach any target"""
         targets = self.find_targets(unit)
         #print(unit.name, targets[:5])
+        if not targets[0]:
+            return None
         return _choices(targets[0][:5], weights=targets[1][:5])[0]
 
     def find_targets(self, unit):
-        """Rank targets for the given unit"""
-        cities = [c for c in self.game.cities if c.owner is not self.player]
-        units = [u for u in self.game.units if u.owner is not self.player]
-        scores = [(c, self.score_target(unit, c)) for c in cities]
-        scores.extend([(u, self.score_target(unit, u)) for u in units])
+        """Rank the nearest targets the given unit can reach
+
+        The route length and first step to each are found by one search,
+        the first steps are kept in first_steps for move_unit"""
+        targets = [c for c in self.game.cities if c.owner is not self.player]
+        targets.extend(u for u in self.game.units if u.owner is not self.player)
+        at = {}
+        for t in targets:
+            at.setdefault(t.coords, []).append(t)
+        scores = []
+        self.first_steps = {}
+        self.first_steps_from = (unit, unit.coords)
+        for coords, distance, step in nearest_targets(unit.coords, list(at), self.game.map,
+                                                      unit.cannot_enter, self.num_targets):
+            for t in at[coords]:
+                scores.append((t, self.score_target(unit, t, distance)))
+                self.first_steps[t] = step
         scores.sort(key=lambda tup: tup[1], reverse=True)
         return [t[0] for t in scores], [t[1] for t in scores]
 
-    def score_target(self, unit, target):
-        """Calculate the score for the given target and unit"""
+    def score_target(self, unit, target, distance):
+        """Calculate the score for the given target and unit
+
+        distance is the length of the unit's route to the target"""
         if isinstance(target, City):
-            return self.base_scores[City] / unit.distance_to(target)
+            return self.base_scores[City] / distance
         elif isinstance(target, Infantry):
-            return self.base_scores[Infantry] / unit.distance_to(target)
+            return self.base_scores[Infantry] / distance
@@ -18,17 +18,31 @@
 #
 #     Work started on 19 December, 2019
 
+import os
+import sys
 import Controller
 from GameWindow import GameWindow
+from BaseObjects import Map
+from GridMap import GridMap
+import Pathfinding
 import pygame
 
 
 if __name__ == "__main__":
     image_size = 32
     size = (30, 30)
+    map_file = sys.argv[1] if len(sys.argv) > 1 else None  #optional saved map
+    #optional file to append the pathfinding statistics to, as JSON lines
+    stats_file = os.environ.get('PYRE_PATH_STATS')
+    if stats_file:
+        Pathfinding.enable_stats()
 
-    W = Controller.World(size)
+    #A GridMap keeps a saved map memory mapped instead of copying it
+    map_class = GridMap if map_file else Map
+    W = Controller.World(size, map_class=map_class, map_file=map_file)
     GW = GameWindow(W, image_size)
 
     GW.mainloop()
-    GW.quit()
\ No newline at end of file
+    GW.quit()
+    if stats_file:
+        Pathfinding.disable_stats().dump(stats_file)
\ No newline at end of file
@@ -1,5 +1,16 @@
+import json
+import os
+import random
+import tempfile
 import unittest
-from BaseObjects import Map, a_star
+import numpy as np
+from Cities import City
+from BaseObjects import Map, MapOverlay, a_star
+import MapBuilder
+import Pathfinding
+from Pathfinding import find_path, find_paths, hpa_star, nearest_targets, FlowFields, PathCache, DStarLite, \
+    GotoOrder, cooperative_paths, distance_field, wavefront, wavefront_path, alt_star, budgeted_a_star, jps, \
+    path_found, path_partial, no_route, unknown_score
 
 class MyTestCase(unittest.TestCase):
 
@@ -112,5 +123,497 @@ class MyTestCase(unittest.TestCase):
             test_map[(x, 5)] = 'water'
         self.assertFalse(a_star((1, 1), (9, 9), test_map))
 
+
+def random_map(seed, dims=(20, 15), frac_water=0.3):
+    """Return a Map with scattered water for comparing pathfinders"""
+    rng = random.Random(seed)
+    test_map = Map(dims=dims)
+    for x in range(1, dims[0]):
+        for y in range(1, dims[1]):
+            if rng.random() < frac_water:
+                test_map[(x, y)] = 'water'
+    return test_map, rng
+
+
+def check_route(test_case, test_map, route, start, goal):
+    """Check a route is a chain of single steps over passable squares"""
+    test_case.assertEqual(start, route[0])
+    test_case.assertEqual(goal, route[-1])
+    for (x0, y0), (x1, y1) in zip(route, route[1:]):
+        test_case.assertEqual(1, max(abs(x1 - x0), abs(y1 - y0)))
+        test_case.assertTrue(test_map.can_enter((x1, y1), ['edge', 'water']))
+
+
+class JPSTestCase(unittest.TestCase):
+
+    def test_matches_a_star(self):
+        for seed in range(30):
+            test_map, rng = random_map(seed)
+            start = (rng.randint(1, 19), rng.randint(1, 14))
+            goal = (rng.randint(1, 19), rng.randint(1, 14))
+            route = find_path(start, goal, test_map, method='jps')
+            best = a_star(start, goal, test_map)
+            if not best:
+                self.assertFalse(route)
+                continue
+            check_route(self, test_map, route, start, goal)
+            self.assertEqual(len(best), len(route))
+
+    def test_open_field(self):
+        test_map = Map(dims=(40, 40))
+        route = find_path((1, 1), (39, 20), test_map, method='jps')
+        self.assertEqual(39, len(route))
+        self.assertListEqual([(5, 5)], find_path((5, 5), (5, 5), test_map, method='jps'))
+
+
+class BidirectionalTestCase(unittest.TestCase):
+
+    def test_matches_a_star(self):
+        for seed in range(30):
+            test_map, rng = random_map(seed, frac_water=0.35)
+            start = (rng.randint(1, 19), rng.randint(1, 14))
+            goal = (rng.randint(1, 19), rng.randint(1, 14))
+            route = find_path(start, goal, test_map, method='bidirectional')
+            best = a_star(start, goal, test_map)
+            if not best:
+                self.assertFalse(route)
+                continue
+            check_route(self, test_map, route, start, goal)
+            self.assertEqual(len(best), len(route))
+
+    def test_auto(self):
+        test_map = Map(dims=(60, 60))
+        for y in range(1, 50):
+            test_map[(30, y)] = 'water'
+        for start, goal in [((1, 1), (59, 1)), ((1, 1), (5, 9))]:
+            route = find_path(start, goal, test_map, method='auto')
+            check_route(self, test_map, route, start, goal)
+            self.assertEqual(len(a_star(start, goal, test_map)), len(route))
+
+    def test_blocked_goal(self):
+        overlay = MapOverlay(Map(dims=(10, 10)), blocked=[(5, 5)])
+        for method in ('bidirectional', 'auto'):
+            self.assertFalse(find_path((2, 2), (5, 5), overlay, method=method))
+        self.assertTrue(find_path((2, 2), (5, 6), overlay, method='bidirectional'))
+
+
+class FindPathsTestCase(unittest.TestCase):
+
+    def test_batch_order(self):
+        test_map, rng = random_map(4, dims=(40, 30))
+        overlay = MapOverlay(test_map, blocked=[(20, y) for y in range(1, 25)])
+        requests = [((rng.randint(1, 39), rng.randint(1, 29)), (rng.randint(1, 39), rng.randint(1, 29)),
+                     ['edge', 'water']) for i in range(20)]
+        expected = [a_star(start, goal, overlay, cannot_enter) for start, goal, cannot_enter in requests]
+        self.assertListEqual(expected, find_paths(requests, overlay, max_workers=2))
+        pool = Pathfinding._pool
+        self.assertListEqual(expected, find_paths(requests, overlay, max_workers=2))
+        self.assertIs(pool, Pathfinding._pool)  #kept for the same map
+        self.assertListEqual(expected[:3], find_paths(requests[:3], overlay))
+        Pathfinding.shutdown_pool()
+
+
+class HPATestCase(unittest.TestCase):
+
+    def test_routes(self):
+        for seed in range(30):
+            test_map, rng = random_map(seed, dims=(30, 20), frac_water=0.2)
+            start = (rng.randint(1, 29), rng.randint(1, 19))
+            goal = (rng.randint(1, 29), rng.randint(1, 19))
+            best = a_star(start, goal, test_map)
+            route = hpa_star(start, goal, test_map, cluster_size=4)
+            if not best:
+                self.assertFalse(route)
+                continue
+            check_route(self, test_map, route, start, goal)
+            self.assertLessEqual(len(route), 1.5 * len(best))
+            check_route(self, test_map, find_path(start, goal, test_map, method='hpa'), start, goal)
+            first_leg = hpa_star(start, goal, test_map, refine=1, cluster_size=4)
+            self.assertListEqual(route[:2], first_leg[:2])
+            self.assertEqual(goal, first_leg[-1])
+
+    def test_rebuild_changed_clusters(self):
+        test_map = Map(dims=(40, 40))
+        graph = test_map.cluster_graph(['edge', 'water'], 4)
+        self.assertTrue(hpa_star((1, 1), (38, 38), test_map, cluster_size=4))
+        rebuilds = graph.rebuilds
+        test_map[(10, 10)] = 'water'  #inside cluster (2, 2)
+        test_map[(12, 12)] = 'water'  #on the boundaries of cluster (3, 3)
+        test_map[(14, 14)] = 'city'  #still passable
+        hpa_star((1, 1), (38, 38), test_map, cluster_size=4)
+        self.assertEqual(4, graph.rebuilds - rebuilds)
+
+
+class NearestTargetsTestCase(unittest.TestCase):
+
+    def test_nearest(self):
+        """
+         01234567890
+        0EEEEEEEEEEE
+        1EPPPPPPPPPE
+        2EPPPPPPPPPE
+        3EPPPPPPPPPE
+        4EPPPPPPPPPE
+        5EWWWWWWW.WE
+        6EPPPPPPPPPE
+        7EPPPPPPPPPE
+        8EPPPPPPPPPE
+        9EPPPPPPPPPE
+        0EEEEEEEEEEE
+        """
+        test_map = Map()
+        for x in [1, 2, 3, 4, 5, 6, 7, 9]:
+            test_map[(x, 5)] = 'water'
+        targets = [(2, 7), (8, 2), (2, 2), (5, 5)]
+        found = nearest_targets((2, 4), targets, test_map, k=2)
+        self.assertListEqual([((2, 2), 2), ((8, 2), 6)], [f[:2] for f in found])
+        for target, distance, step in found:
+            self.assertEqual(1, max(abs(step[0] - 2), abs(step[1] - 4)))
+            self.assertEqual(distance, len(a_star(step, target, test_map)))
+        found = nearest_targets((2, 4), targets, test_map)
+        self.assertListEqual([(2, 2), (8, 2), (2, 7)], [f[0] for f in found])
+        self.assertEqual(len(a_star((2, 4), (2, 7), test_map)) - 1, found[2][1])
+        self.assertListEqual([], nearest_targets((2, 4), [(2, 4)], test_map))
+
+
+class BudgetedTestCase(unittest.TestCase):
+
+    def test_budget(self):
+        """
+         01234567890
+        0EEEEEEEEEEE
+        1EPPPPPPPPPE
+        2EPPPPPPPPPE
+        3EPPPPPPPPPE
+        4EPPPPPPPPPE
+        5EWWWWWW.WWE
+        6EPPPPPPPPPE
+        7EPPPPPPPPPE
+        8EPPPPPPPPPE
+        9EPPPPPPPPPE
+        0EEEEEEEEEEE
+        """
+        test_map = Map()
+        for x in [1, 2, 3, 4, 5, 6, 8, 9]:
+            test_map[(x, 5)] = 'water'
+        status, path = budgeted_a_star((1, 1), (1, 9), test_map)
+        self.assertEqual(path_found, status)
+        self.assertEqual(len(a_star((1, 1), (1, 9), test_map)), len(path))
+        status, path = budgeted_a_star((1, 1), (1, 9), test_map, max_nodes=5)
+        self.assertEqual(path_partial, status)
+        check_route(self, test_map, path, (1, 1), path[-1])
+        self.assertEqual(4, path[-1][1])  #as close as the water lets it get
+        status, path = budgeted_a_star((1, 1), (99, 99), Map(dims=(100, 100)), deadline=0)
+        self.assertEqual(path_partial, status)
+        self.assertLess(len(path), 99)
+        blocked = MapOverlay(test_map, blocked=[(7, 5)])
+        status, path = budgeted_a_star((1, 1), (1, 9), blocked)
+        self.assertEqual(no_route, status)
+        self.assertEqual(4, path[-1][1])
+        test_map[(7, 5)] = 'water'
+        self.assertEqual((no_route, False), budgeted_a_star((1, 1), (1, 9), test_map))
+
+
+class LandmarkTestCase(unittest.TestCase):
+
+    def test_matches_a_star(self):
+        for seed in range(10):
+            test_map, rng = random_map(seed, dims=(30, 20))
+            for _ in range(10):
+                start, goal = rng.sample(test_map['plains'], 2)
+                route = a_star(start, goal, test_map)
+                alt_route = alt_star(start, goal, test_map)
+                self.assertEqual(bool(route), bool(alt_route))
+                if route:
+                    check_route(self, test_map, alt_route, start, goal)
+                    self.assertEqual(len(route), len(alt_route))
+
+    def test_bounds(self):
+        test_map, rng = random_map(4, dims=(30, 20))
+        test_map[(15, 10)] = 'city'
+        table = test_map.landmark_table(['edge', 'water'])
+        self.assertIn((15, 10), table.landmarks)
+        goal = (15, 10)
+        bounds = table.bounds(goal)
+        distance = distance_field(goal, test_map)
+        for i, d in enumerate(distance):
+            if d < unknown_score:
+                self.assertLessEqual(bounds[i], d)
+
+    def test_rebuild(self):
+        test_map = MapBuilder.map_builder((40, 40))[0]
+        land = ['edge', 'water']
+        table = test_map.landmark_table(land)
+        x, y = test_map['plains'][0]
+        test_map[(x, y)] = 'city'
+        self.assertIs(table, test_map.landmark_table(land))
+        test_map[(x, y)] = 'water'
+        self.assertIsNot(table, test_map.landmark_table(land))
+        overlay = MapOverlay(test_map, blocked=[test_map['plains'][0]])
+        self.assertIs(test_map.landmark_table(land), overlay.landmark_table(land))
+        overlay = MapOverlay(test_map, overrides={(x, y): 'plains'})
+        self.assertIsNone(overlay.landmark_table(land))
+
+
+class WavefrontTestCase(unittest.TestCase):
+
+    def test_matches_distance_field(self):
+        for seed in range(10):
+            test_map, rng = random_map(seed)
+            sources = rng.sample(test_map['plains'], 3)
+            distance, parent = wavefront(sources, test_map.passable_array(['edge', 'water']))
+            nearest = np.full(test_map.shape, unknown_score)
+            for source in sources:
+                field = np.array(distance_field(source, test_map)).reshape(test_map.shape)
+                nearest = np.minimum(nearest, field)
+            self.assertTrue((nearest == distance).all())
+            for xy in test_map['plains']:
+                if distance[xy] < unknown_score:
+                    route = wavefront_path(parent, xy)
+                    check_route(self, test_map, route, xy, route[-1])
+                    self.assertIn(route[-1], sources)
+                    self.assertEqual(distance[xy], len(route) - 1)
+
+    def test_max_steps(self):
+        test_map = Map()
+        distance, parent = wavefront([(1, 1)], test_map.passable_array(['edge', 'water']), max_steps=3)
+        self.assertEqual(16, (distance <= 3).sum())
+        self.assertEqual(unknown_score, distance[5, 5])
+        self.assertListEqual([(4, 2), (3, 1), (2, 1), (1, 1)], wavefront_path(parent, (4, 2)))
+
+
+class FlowFieldsTestCase(unittest.TestCase):
+
+    def test_next_steps(self):
+        test_map, rng = random_map(3)
+        flow_fields = FlowFields(test_map)
+        goal = (18, 13)
+        test_map[goal] = 'plains'
+        for start in [(1, 1), (5, 10), (12, 2)]:
+            route = a_star(start, goal, test_map)
+            steps = [start]
+            while steps[-1] != goal and len(steps) <= len(route):
+                steps.append(flow_fields.next_step(steps[-1], goal, ['edge', 'water']))
+            check_route(self, test_map, steps, start, goal)
+            self.assertEqual(len(route), len(steps))
+        self.assertEqual(1, len(flow_fields.fields))
+
+    def test_invalidation(self):
+        test_map = Map()
+        flow_fields = FlowFields(test_map)
+        field = flow_fields.field((9, 9), ['edge', 'water'])
+        self.assertIs(field, flow_fields.field((9, 9), ['water', 'edge']))
+        blocked_field = flow_fields.field((9, 9), ['edge', 'water'], blocked=[(8, 8)])
+        self.assertIsNot(field, blocked_field)
+        self.assertEqual(unknown_score, blocked_field[8 * 11 + 8])
+        self.assertEqual((8, 9), flow_fields.next_step((7, 8), (9, 9), ['edge', 'water'],
+                                                       blocked=[(8, 8)]))
+        test_map[(5, 5)] = 'water'
+        self.assertIsNot(blocked_field, flow_fields.field((9, 9), ['edge', 'water'], blocked=[(8, 8)]))
+        self.assertEqual((8, 9), flow_fields.next_step((7, 8), (9, 9), ['edge', 'water'],
+                                                       avoid=[(8, 8)]))
+
+
+class PathCacheTestCase(unittest.TestCase):
+
+    def test_hits_and_suffixes(self):
+        test_map = Map()
+        cache = PathCache(max_size=2)
+        route = cache.find_path((1, 1), (9, 9), test_map)
+        self.assertListEqual(route, cache.find_path((1, 1), (9, 9), test_map))
+        self.assertListEqual(route[3:], cache.find_path(route[3], (9, 9), test_map))
+        self.assertEqual((2, 1, 1), (cache.hits, cache.suffix_hits, cache.misses))
+        cache.find_path((1, 1), (9, 9), test_map, method='jps')
+        cache.find_path((1, 1), (5, 9), test_map)
+        self.assertEqual((3, 1), (cache.misses, cache.evictions))
+
+    def test_stale_paths(self):
+        test_map = Map()
+        cache = PathCache()
+        route = cache.find_path((1, 1), (9, 9), test_map)
+        overlay = MapOverlay(test_map, blocked=[(5, 5)])
+        self.assertNotIn((5, 5), cache.find_path((1, 1), (9, 9), overlay))
+        test_map[(5, 5)] = 'water'
+        self.assertNotIn((5, 5), cache.find_path((1, 1), (9, 9), test_map))
+        self.assertEqual((0, 3), (cache.hits, cache.misses))
+        self.assertIn((5, 5), route)
+
+
+class DStarLiteTestCase(unittest.TestCase):
+
+    def test_replanning(self):
+        """
+         01234567890
+        0EEEEEEEEEEE
+        1EsPPPPPPPPE
+        2EPPPPPPPPPE
+        3EPPPPPPPPPE
+        4EPPPPPPPPPE
+        5EWWWWWW.W.E
+        6EPPPPPPPPPE
+        7EPPPPPPPPPE
+        8EPPPPPPPPPE
+        9EPPPPPPPPgE
+        0EEEEEEEEEEE
+        """
+        test_map = Map()
+        for x in [1, 2, 3, 4, 5, 6, 8]:
+            test_map[(x, 5)] = 'water'
+        planner = DStarLite((1, 1), (9, 9), test_map)
+        self.assertEqual((2, 2), planner.next_step((1, 1)))
+        self.assertIn((7, 5), planner.path())
+        expansions = planner.expansions
+        route = [(2, 2), planner.next_step((2, 2), blocked=[(7, 5)])]
+        fresh = DStarLite((2, 2), (9, 9), test_map, blocked=[(7, 5)])
+        self.assertEqual(route[-1], fresh.next_step((2, 2), blocked=[(7, 5)]))
+        self.assertLess(planner.expansions - expansions, fresh.expansions)
+        while route[-1] != (9, 9):
+            route.append(planner.next_step(route[-1], blocked=[(7, 5)]))
+        check_route(self, test_map, [(1, 1)] + route, (1, 1), (9, 9))
+        self.assertIn((9, 5), route)
+        self.assertEqual(len(a_star((1, 1), (9, 9), MapOverlay(test_map, blocked=[(7, 5)]))),
+                         len(route) + 1)
+        self.assertEqual((3, 3), fresh.next_step((2, 2), blocked=[(7, 5)]))
+        test_map[(9, 5)] = 'water'  #the map changed under the planner
+        self.assertIsNone(fresh.next_step((3, 3), blocked=[(7, 5)]))
+
+    def test_budget(self):
+        test_map = Map(dims=(30, 30))
+        whole = DStarLite((1, 1), (28, 28), test_map)
+        step = whole.next_step((1, 1))
+        planner = DStarLite((1, 1), (28, 28), test_map)
+        far = DStarLite((1, 1), (99, 99), Map(dims=(100, 100)))
+        self.assertIsNone(far.next_step((1, 1), deadline=0))
+        self.assertEqual(Pathfinding.deadline_check_interval, far.expansions)
+        calls = 0
+        while planner.next_step((1, 1), max_nodes=5) is None:
+            calls += 1
+            self.assertLessEqual(planner.expansions, 5 * calls)
+        self.assertEqual(step, planner.next_step((1, 1)))
+        self.assertEqual(whole.expansions, planner.expansions)  #each call went on from the last
+
+
+class CooperativePathsTestCase(unittest.TestCase):
+
+    def test_no_collisions(self):
+        """Random maps and units; the first step of the plans never collides"""
+        random.seed(3)
+        for trial in range(50):
+            test_map = Map(dims=(random.randint(5, 15), random.randint(5, 15)))
+            for x in range(1, test_map.dims[0]):
+                for y in range(1, test_map.dims[1]):
+                    if random.random() < 0.2:
+                        test_map[(x, y)] = 'water'
+            free = list(test_map['plains'])
+            random.shuffle(free)
+            n = random.randint(1, 6)
+            goals = free[n:n + 3] + [None]
+            requests = [(s, random.choice(goals), ['edge', 'water']) for s in free[:n]]
+            paths = cooperative_paths(requests, test_map, FlowFields(test_map), window=6)
+            now = [p[0] for p in paths]
+            after = [p[min(1, len(p) - 1)] for p in paths]
+            self.assertEqual(n, len(set(after)))
+            for a in range(n):
+                self.assertNotIn(after[a], now[:a] + now[a + 1:])  #no following
+            for p, (start, goal, cannot_enter) in zip(paths, requests):
+                self.assertEqual(start, p[0])
+                for (x0, y0), (x1, y1) in zip(p, p[1:]):
+                    self.assertLessEqual(max(abs(x1 - x0), abs(y1 - y0)), 1)  #or waits
+                    self.assertTrue(test_map.can_enter((x1, y1), cannot_enter))
+
+
+class GotoOrderTestCase(unittest.TestCase):
+
+    def test_follow_route(self):
+        test_map = Map()
+        for x in [1, 2, 3, 4, 5, 6, 8]:
+            test_map[(x, 5)] = 'water'
+        order = GotoOrder((9, 9))
+        route = [(1, 1)]
+        while route[-1] != (9, 9):
+            route.append(order.next_step(route[-1], test_map))
+        check_route(self, test_map, route, (1, 1), (9, 9))
+        self.assertEqual(0, order.replans)
+        self.assertEqual(len(route) - 1, len(order.route))
+        self.assertIsNone(order.next_step((9, 9), test_map))
+
+    def test_replan(self):
+        test_map = Map()
+        target = City('Bree', (9, 9))
+        order = GotoOrder(target)
+        step = order.next_step((1, 1), test_map)
+        self.assertEqual((2, 2), step)
+        self.assertEqual((3, 3), order.next_step(step, test_map))
+        self.assertEqual(0, order.replans)
+        self.assertNotEqual((3, 3), order.next_step(step, test_map, blocked=[(3, 3)]))
+        self.assertEqual(1, order.replans)
+        target.coords = (2, 8)  #the target moved
+        self.assertEqual(3, order.next_step(step, test_map)[1])
+        self.assertEqual(2, order.replans)
+        self.assertEqual(6, order.steps_left())
+
+    def test_shared_cache(self):
+        test_map = Map()
+        cache = PathCache()
+        lead = GotoOrder((9, 9), cache=cache)
+        step = lead.next_step((1, 1), test_map)
+        follower = GotoOrder((9, 9), cache=cache)
+        self.assertEqual((3, 3), follower.next_step(step, test_map))  #the rest of the lead's route
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, cache.suffix_hits)
+
+
+class PathStatsTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        Pathfinding.disable_stats()
+
+    def test_recording(self):
+        test_map, rng = random_map(5)
+        route = a_star((1, 1), (18, 13), test_map)
+        self.assertIsNone(Pathfinding.stats)
+        stats = Pathfinding.enable_stats()
+        self.assertEqual(route, a_star((1, 1), (18, 13), test_map))
+        jps((1, 1), (18, 13), test_map)
+        distance_field((18, 13), test_map)
+        cache = PathCache()
+        cache.find_path((1, 1), (18, 13), test_map)
+        cache.find_path((1, 1), (18, 13), test_map)
+        self.assertEqual(['a_star', 'cache', 'distance_field', 'jps'], stats.kinds())
+        query = stats.queries[0]
+        self.assertEqual(len(route), query['length'])
+        self.assertEqual(path_found, query['status'])
+        self.assertLessEqual(len(route) - 1, query['expanded'])
+        self.assertGreater(query['peak_open'], 0)
+        summary = stats.summary()
+        self.assertEqual(2, summary['a_star']['count'])  #one more from the cache miss
+        self.assertEqual(0.5, summary['cache']['hit_rate'])
+        self.assertNotIn('length', summary['distance_field'])
+        self.assertEqual(len(route), stats.percentiles('length', 'a_star')['p50'])
+        self.assertIs(stats, Pathfinding.disable_stats())
+        a_star((1, 1), (18, 13), test_map)
+        self.assertEqual(6, len(stats.queries))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'stats.jsonl')
+            stats.dump(path)
+            with open(path) as f:
+                self.assertEqual(stats.queries, [json.loads(line) for line in f])
+
+    def test_workers_and_planners(self):
+        test_map, rng = random_map(6, dims=(30, 30))
+        requests = [((rng.randint(1, 29), rng.randint(1, 29)), (rng.randint(1, 29), rng.randint(1, 29)),
+                     ['edge', 'water']) for i in range(20)]
+        stats = Pathfinding.enable_stats()
+        find_paths(requests, test_map, max_workers=2)
+        Pathfinding.shutdown_pool()
+        self.assertEqual(len(requests), len(stats.values('expanded', 'a_star')))
+        planner = DStarLite((1, 1), (28, 28), test_map)
+        planner.next_step((1, 1))
+        planner.next_step((1, 1))
+        first, repeat = stats.values('expanded', 'dstar')
+        self.assertGreater(first, 0)
+        self.assertEqual(0, repeat)  #nothing changed, nothing to repair
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+import random
+import unittest
+from pygame.locals import K_KP2, K_KP8
+import Controller
+import Game
+from GroundUnits import Infantry
+from Player_AI import AI
+
+
+class Plane(object):
+    """Stands in for the game window's sprite of a city or unit"""
+
+    def destroy(self):
+        pass
+
+
+class OccupancyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(2)
+        self.game = Game.Game((30, 30))
+
+    def test_lookups(self):
+        G = self.game
+        for c in G.cities:
+            self.assertIs(c, G.occupancy.at(c.coords))
+        player = G.players[0]
+        unit = player.units[0]
+        self.assertIs(G.cities[0], unit.check_collision(unit.coords, G))  #the city comes first
+        free = [xy for xy in G.map['plains'] if G.occupancy.at(xy) is None
+                and G.map.can_enter((xy[0], xy[1] + 1), unit.cannot_enter)
+                and G.occupancy.at((xy[0], xy[1] + 1)) is None]
+        start = free[0]
+        infantry = Infantry(coords=start)
+        player.assign_unit(infantry)
+        self.assertIs(infantry, infantry.check_collision(start, G))
+        self.assertTrue(infantry.move(K_KP2, G))
+        self.assertIsNone(G.occupancy.at(start))
+        self.assertIs(infantry, G.occupancy.at((start[0], start[1] + 1)))
+        infantry.moved = 0
+        self.assertTrue(infantry.move(K_KP8, G))
+        player.remove_unit(infantry)
+        self.assertIsNone(infantry.check_collision(start, G))
+        self.assertNotIn(infantry, player.units)
+
+
+class AITestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(2)
+        self.game = Game.Game((30, 30))
+
+    def test_move_around_friendly_units(self):
+        G = self.game
+        player = G.players[0]
+        ai = AI(player, G)
+        unit = ai.moving_unit = player.units[0]
+        target = ai.select_target(unit)
+        self.assertTrue(ai.move_unit(target)[0])
+        ring = [n for n in G.map.neighbors(unit.coords)
+                if G.map.can_enter(n, unit.cannot_enter) and G.occupancy.at(n) is None]
+        distance = G.flow_fields.field(target.coords, unit.cannot_enter)
+        last = max(ring, key=lambda n: distance[n[0] * 31 + n[1]])  #leaves no step closer
+        for xy in ring:
+            if xy != last:
+                player.assign_unit(Infantry(coords=xy))
+        dir, key = ai.move_unit(target)
+        self.assertEqual(last, (unit.coords[0] + dir[0], unit.coords[1] + dir[1]))
+        self.assertIn(unit, ai.planners)  #routed around them by its planner
+        player.assign_unit(Infantry(coords=last))
+        self.assertEqual((False, False), ai.move_unit(target))
+
+    def test_waiting_unit_uses_planner(self):
+        G = self.game
+        player = G.players[0]
+        ai = AI(player, G)
+        ai.move_delay = 0
+        unit = player.units[0]
+        for xy in G.map.neighbors(unit.coords):
+            if G.map.can_enter(xy, unit.cannot_enter) and G.occupancy.at(xy) is None:
+                player.assign_unit(Infantry(coords=xy))
+        for u in player.units:
+            if u is not unit:
+                u.moved = u.move_speed
+        self.assertEqual(['End Turn'], ai.next_move())  #the unit has no way out
+        self.assertIn(unit, ai.waiting)  #boxed in by the plan
+        self.assertIn(unit, ai.planners)  #so its planner was asked for a way round
+
+    def test_next_move(self):
+        random.seed(3)
+        W = Controller.World((30, 30))
+        G = W.G
+        for player in G.players:
+            player.AI = player.AI or AI(player, G)
+            player.AI.move_delay = 0
+        calls = 0
+        while G.turn <= 8 and len(G.players) > 1:
+            calls += 1
+            self.assertLess(calls, 5000)  #every call selects, moves or ends the turn
+            for c in G.cities + G.units:
+                c.plane = c.plane or Plane()
+            msgs = G.current_player.AI.next_move()
+            self.assertIsInstance(msgs, list)
+            if 'End Turn' in msgs:
+                W.step()
+            elif msgs[0] == 'move':
+                W.move_unit(msgs[1], msgs[2])
+        self.assertGreater(G.turn, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,265 @@
+import os
+import tempfile
+import unittest
+from copy import copy
+import numpy as np
+from BaseObjects import Map, MapOverlay, a_star, label_components
+from GridMap import GridMap
+from ChunkedMap import ChunkedMap
+from Cities import City
+import MapFile
+
+
+class MapTestCase(unittest.TestCase):
+
+    def test_terrain_index(self):
+        test_map = Map()
+        test_map[(2, 2)] = 'water'
+        self.assertListEqual([(2, 2)], test_map['water'])
+        self.assertEqual(80, len(test_map['plains']))
+        test_map[(3, 3)] = 'water'
+        test_map[(2, 2)] = 'city'
+        self.assertListEqual([(3, 3)], test_map['water'])
+        self.assertListEqual([(2, 2)], test_map['city'])
+        self.assertEqual(79, len(test_map['plains']))
+        self.assertEqual(40, len(test_map['edge']))
+
+    def test_count(self):
+        test_map = Map()
+        self.assertEqual(81, test_map.count('plains'))
+        self.assertEqual(40, test_map.count('edge'))
+        test_map[(2, 2)] = 'water'
+        test_map[(2, 2)] = 'water'
+        test_map[(0, 2)] = 'water'  #edges stay edges
+        self.assertEqual(1, test_map.count('water'))
+        self.assertEqual(80, test_map.count('plains'))
+        del test_map[(2, 2)]
+        self.assertEqual(0, test_map.count('water'))
+
+    def test_passability(self):
+        for test_map in (Map(), GridMap()):
+            self.assertTrue(test_map.can_enter((2, 2), ['edge', 'water']))
+            layer = test_map.passability(['edge', 'water'])
+            test_map[(2, 2)] = 'water'
+            self.assertEqual(0, layer[2 * 11 + 2])
+            self.assertFalse(test_map.can_enter((2, 2), ['water', 'edge']))
+            self.assertFalse(test_map.can_enter((0, 5), ['edge', 'water']))
+            self.assertTrue(test_map.can_enter((2, 2), ['edge']))
+            self.assertFalse(test_map.can_enter((12, 5), ['edge']))
+            mask = test_map.passable_array(['edge', 'water'], blocked=[(3, 3)])
+            self.assertEqual(9 * 9 - 2, mask.sum())
+
+
+    def test_neighbors_off_map(self):
+        test_map = Map()
+        self.assertEqual(5, len(test_map.neighbors((5, 0))))
+        self.assertEqual(((0, 6), (0, 5), (0, 4)), test_map.neighbors((-1, 5)))
+        self.assertEqual(((0, 10),), test_map.cardinal_neighbors((0, 11)))
+        self.assertEqual((), test_map.diagonal_neighbors((20, 20)))
+
+
+class RegionQueryTestCase(unittest.TestCase):
+
+    def test_queries_match(self):
+        for test_map in (Map(), GridMap(), ChunkedMap(chunk_size=4)):
+            test_map[(2, 2)] = 'water'
+            test_map[(2, 3)] = 'water'
+            codes = test_map.code_array()
+            test_map[(3, 3)] = 'water'  #kept up to date after it is built
+            water = test_map.terrain_names.index('water')
+            if not isinstance(test_map, ChunkedMap):  #builds a fresh array each call
+                self.assertEqual(water, codes[3, 3])
+            self.assertEqual(water, test_map.code_array()[3, 3])
+            self.assertListEqual([water, 0, 1], test_map.terrain_at([(2, 2), (5, 5), (0, 4)]).tolist())
+            self.assertEqual((1, 2), test_map.rect(-1, 9, 1, 12).shape)
+            coords, near = test_map.within((1, 1), 1)
+            self.assertEqual(9, len(coords))
+            self.assertEqual(1, (near == water).sum())
+            self.assertEqual(3, test_map.window_counts((2, 2), 1)[water])
+            self.assertEqual(2, test_map.neighbor_counts(['water'])[2, 2])
+            self.assertEqual(0, test_map.neighbor_counts(['water'], 'diagonal')[2, 3])
+
+
+class ComponentsTestCase(unittest.TestCase):
+
+    def test_islands(self):
+        for test_map in (Map(), GridMap(), ChunkedMap(chunk_size=4)):
+            for y in range(1, 10):
+                test_map[(5, y)] = 'water'
+            land = ['edge', 'water']
+            self.assertFalse(test_map.same_component((2, 2), (8, 8), land))
+            self.assertTrue(test_map.same_component((2, 2), (4, 9), land))
+            self.assertTrue(test_map.same_component((5, 2), (5, 8), ['edge']))
+            self.assertFalse(test_map.same_component((2, 2), (5, 8), land))
+            self.assertFalse(a_star((2, 2), (8, 8), test_map))
+            test_map[(5, 5)] = 'plains'
+            self.assertTrue(test_map.same_component((2, 2), (8, 8), land))
+            self.assertTrue(test_map.same_component((5, 5), (8, 8), land))
+            test_map[(5, 5)] = 'water'
+            self.assertFalse(test_map.same_component((2, 2), (8, 8), land))
+            self.assertTrue(test_map.same_component((5, 5), (8, 8), land))  #can leave the water
+            overlay = MapOverlay(test_map, overrides={(5, 6): 'plains'})
+            self.assertTrue(overlay.same_component((2, 2), (8, 8), land))
+
+    def test_diagonal_runs(self):
+        passable = np.zeros((6, 6), dtype=np.bool_)
+        passable[1, 1:3] = passable[2, 3] = passable[3, 4] = True  #joined diagonally
+        passable[1, 5] = True
+        labels = label_components(passable)
+        self.assertEqual(2, labels.max())
+        self.assertEqual(labels[1, 1], labels[3, 4])
+        self.assertNotEqual(labels[1, 1], labels[1, 5])
+
+
+class MapOverlayTestCase(unittest.TestCase):
+
+    def test_overlay(self):
+        test_map = Map()
+        test_map[(2, 2)] = 'water'
+        layer = test_map.passability(['edge', 'water'])
+        overlay = MapOverlay(test_map, blocked=[(3, 3)], overrides={(2, 2): 'plains'})
+        self.assertEqual('edge', overlay[(3, 3)])
+        self.assertEqual('plains', overlay[(2, 2)])
+        self.assertEqual('plains', test_map[(3, 3)])
+        self.assertEqual([], overlay['water'])
+        self.assertEqual(0, overlay.count('water'))
+        self.assertTrue(overlay.can_enter((2, 2), ['edge', 'water']))
+        self.assertFalse(overlay.can_enter((3, 3), ['edge', 'water']))
+        self.assertEqual(0, layer[2 * 11 + 2])
+        self.assertEqual(1, layer[3 * 11 + 3])
+        overlay_layer = overlay.passability(['edge', 'water'])
+        self.assertEqual(1, overlay_layer[2 * 11 + 2])
+        self.assertEqual(0, overlay_layer[3 * 11 + 3])
+        self.assertEqual(bytes(overlay_layer),
+                         overlay.passable_array(['edge', 'water']).astype(np.uint8).tobytes())
+
+    def test_new_terrain(self):
+        test_map = Map()
+        overlay = MapOverlay(test_map, overrides={(2, 2): 'lava'})
+        codes = overlay.code_array()
+        self.assertEqual('lava', overlay.terrain_names[codes[2, 2]])
+        self.assertNotIn('lava', test_map.terrain_names)
+
+    def test_cache_key(self):
+        test_map = Map()
+        key = test_map.cache_key()
+        del test_map
+        self.assertNotEqual(key, Map().cache_key())  #even if the id is reused
+        test_map = Map()
+        overlay = MapOverlay(test_map, blocked=[(3, 3)])
+        self.assertEqual(overlay.cache_key(), MapOverlay(test_map, blocked=[(3, 3)]).cache_key())
+        self.assertNotEqual(overlay.cache_key(), MapOverlay(test_map, blocked=[(3, 4)]).cache_key())
+
+    def test_a_star_around_blocked(self):
+        test_map = Map()
+        for x in range(1, 10):
+            if x != 5:
+                test_map[(x, 5)] = 'water'
+        overlay = MapOverlay(test_map, blocked=[(5, 5)])
+        self.assertTrue(a_star((1, 1), (9, 9), test_map))
+        self.assertFalse(a_star((1, 1), (9, 9), overlay))
+
+
+class GridMapTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """
+         01234567890
+        0EEEEEEEEEEE
+        1EPPPPPPPPPE
+        2EPPPPPPPPPE
+        3EPPPPPPPPPE
+        4EPPPPPPPPPE
+        5EWWWWWW.WWE
+        6EPPPPPPPPPE
+        7EPPPPPPPPPE
+        8EPPPPPPPPPE
+        9EPPPPPPPPCE
+        0EEEEEEEEEEE
+        """
+        self.map = Map()
+        for x in range(1, 10):
+            if x != 7:
+                self.map[(x, 5)] = 'water'
+        self.map[(9, 9)] = 'city'
+        self.grid = GridMap.from_map(self.map)
+
+    def test_same_terrain(self):
+        for x in range(11):
+            for y in range(11):
+                self.assertEqual(self.map[(x, y)], self.grid[(x, y)])
+
+    def test_terrain_queries(self):
+        self.assertCountEqual(self.map['water'], self.grid['water'])
+        self.assertListEqual([(9, 9)], self.grid['city'])
+        self.assertCountEqual(self.map.items(), self.grid.items())
+        self.assertEqual(9, len(self.grid))
+        self.assertEqual(self.map.count('water'), self.grid.count('water'))
+        self.assertEqual(self.map.count('plains'), self.grid.count('plains'))
+
+    def test_bounds(self):
+        self.assertRaises(KeyError, self.grid.__getitem__, (11, 3))
+        self.assertRaises(TypeError, self.grid.__getitem__, [1, 3])
+
+    def test_copy_is_independent(self):
+        adj_map = copy(self.grid)
+        adj_map[(3, 3)] = 'edge'
+        self.assertEqual('plains', self.grid[(3, 3)])
+        self.assertEqual('edge', adj_map[(3, 3)])
+
+    def test_a_star(self):
+        self.assertEqual(len(a_star((1, 1), (9, 9), self.map)),
+                         len(a_star((1, 1), (9, 9), self.grid)))
+
+
+class ChunkedMapTestCase(unittest.TestCase):
+
+    def test_matches_map(self):
+        test_map = Map()
+        chunked = ChunkedMap(chunk_size=4)
+        for xy in [(1, 1), (2, 5), (6, 6), (9, 3)]:
+            test_map[xy] = 'water'
+            chunked[xy] = 'water'
+        chunked[(5, 5)] = 'plains'
+        self.assertEqual(4, len(chunked.chunks))
+        for x in range(11):
+            for y in range(11):
+                self.assertEqual(test_map[(x, y)], chunked[(x, y)])
+        self.assertCountEqual(test_map['water'], chunked['water'])
+        self.assertCountEqual(test_map['plains'], chunked['plains'])
+        self.assertCountEqual(test_map.items(), chunked.items())
+        self.assertEqual(test_map.passability(['edge', 'water']),
+                         chunked.passability(['edge', 'water']))
+        self.assertEqual(a_star((1, 2), (9, 9), test_map),
+                         a_star((1, 2), (9, 9), chunked))
+        np.testing.assert_array_equal(test_map.neighbor_counts(['water']),
+                                      chunked.neighbor_counts(['water']))
+        self.assertIsNone(chunked._codes)  #no dense copy kept
+
+    def test_chunk_size(self):
+        self.assertRaises(ValueError, ChunkedMap, chunk_size=48)
+
+
+class MapFileTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        test_map = Map(dims=(12, 7))
+        test_map[(3, 4)] = 'water'
+        test_map[(5, 5)] = 'city'
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.map')
+            MapFile.save_map(path, test_map, [City('Bree', (5, 5))])
+            loaded, cities = MapFile.load_map(path)
+            self.assertEqual((12, 7), loaded.dims)
+            self.assertCountEqual(test_map.items(), loaded.items())
+            self.assertEqual(test_map.count('plains'), loaded.count('plains'))
+            self.assertEqual([('Bree', (5, 5))], [(c.name, c.coords) for c in cities])
+            loaded[(3, 4)] = 'plains'  #copy-on-write, the file is unchanged
+            as_map, _ = MapFile.load_map(path, map_class=Map)
+            self.assertIsInstance(as_map, Map)
+            self.assertEqual('water', as_map[(3, 4)])
+            del loaded
+
+
+if __name__ == '__main__':
+    unittest.main()